@@ -2,7 +2,7 @@ import streamlit as st
 import os
 import pandas as pd
 import time
-from utils import load_history, save_uploaded_file
+from utils import load_history, save_uploaded_file, export_name, entry_size, set_pinned, touch_history
 import styles
 
 st.set_page_config(
@@ -49,14 +49,18 @@ with col1:
     )
     
     if uploaded_file is not None:
-        saved_path = save_uploaded_file(uploaded_file)
-        if saved_path:
-            st.session_state['current_file_path'] = saved_path
-            st.toast(f"Arquivo **{uploaded_file.name}** carregado com sucesso!", icon="✅")
-            
-            # Show toast confirmation
-            st.toast(f"Arquivo Ativo: {uploaded_file.name}", icon=None)
-            st.info("Agora navegue para **Dashboard** ou **Editor de Dados** no menu lateral.")
+        # The uploader keeps the file across reruns: ingest each upload only once
+        if st.session_state.get('ingested_upload_id') != uploaded_file.file_id:
+            saved_path = save_uploaded_file(uploaded_file)
+            if saved_path:
+                st.session_state['ingested_upload_id'] = uploaded_file.file_id
+                st.session_state['current_file_path'] = saved_path
+                st.session_state['dataset_paths'] = None
+                st.toast(f"Arquivo **{uploaded_file.name}** carregado com sucesso!", icon="✅")
+                
+                # Show toast confirmation
+                st.toast(f"Arquivo Ativo: {uploaded_file.name}", icon=None)
+        st.info("Agora navegue para **Dashboard** ou **Editor de Dados** no menu lateral.")
 
 
 
@@ -81,23 +85,35 @@ with col2:
     if not history:
         st.info("Nenhum arquivo no histórico.")
     else:
+        # Most recently used first
+        history = sorted(history, key=lambda h: h.get('last_opened', h['timestamp']), reverse=True)
         for item in history:
             # Clean display name
             name = item['original_name']
             
-            col_h1, col_h2 = st.columns([0.7, 0.3])
+            col_h1, col_h2, col_h3 = st.columns([0.6, 0.15, 0.25])
             with col_h1:
-                st.text(f"{name}")
-                st.caption(f"Salvo em: {pd.to_datetime(item['timestamp'], unit='s').strftime('%d/%m/%Y %H:%M')}")
+                st.text(f"{'📌 ' if item.get('pinned') else ''}{name}")
+                st.caption(
+                    f"Salvo em: {pd.to_datetime(item['timestamp'], unit='s').strftime('%d/%m/%Y %H:%M')} "
+                    f"· {entry_size(item) / (1024 * 1024):.1f} MB"
+                )
             
             with col_h2:
+                pin_help = "Desafixar (pode ser removido do cache)" if item.get('pinned') else "Fixar (nunca remover do cache)"
+                if st.button("📌", key=f"pin_{item['timestamp']}", help=pin_help):
+                    set_pinned(item['path'], not item.get('pinned'))
+                    st.rerun()
+            
+            with col_h3:
                 if st.button("Abrir", key=f"hist_{item['timestamp']}"):
                     if os.path.exists(item['path']):
                         st.session_state['current_file_path'] = item['path']
+                        st.session_state['dataset_paths'] = None
+                        touch_history(item['path'])
                         st.toast("Arquivo selecionado!", icon="✅")
                         # Clean name for toast
-                        t_name = os.path.basename(item['path'])
-                        if "_" in t_name: t_name = t_name.split("_", 1)[-1]
+                        t_name = export_name(item['path'])
                         
                         # Queue toast for next run
                         st.session_state['toast_next_run'] = f"Arquivo Ativo: {t_name}"
@@ -105,6 +121,24 @@ with col2:
                     else:
                         st.toast("Arquivo não encontrado no cache.", icon="❌")
 
+        # --- Dataset Mode ---
+        with st.expander("Analisar vários arquivos como um conjunto"):
+            st.caption("Cada arquivo (ex.: uma planilha por mês) vira uma partição de uma única tabela no Dashboard.")
+            labels = {
+                item['path']: f"{item['original_name']} ({pd.to_datetime(item['timestamp'], unit='s').strftime('%d/%m/%Y')})"
+                for item in history
+            }
+            current_set = [p for p in (st.session_state.get('dataset_paths') or []) if p in labels]
+            selected_paths = st.multiselect("Arquivos", list(labels), default=current_set, format_func=labels.get)
+            if st.button("Abrir Conjunto", disabled=len(selected_paths) < 2):
+                st.session_state['dataset_paths'] = selected_paths
+                if not st.session_state.get('current_file_path'):
+                    st.session_state['current_file_path'] = selected_paths[0]
+                for path in selected_paths:
+                    touch_history(path)
+                st.session_state['toast_next_run'] = f"Conjunto Ativo: {len(selected_paths)} arquivos"
+                st.rerun()
+
 st.markdown("---")
 
 st.markdown("### Dicas Rápidas")
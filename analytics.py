@@ -0,0 +1,482 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from utils import load_data, data_version, register_change_listener, parquet_column_bounds, journal_column_values
+from engine import engine_enabled, query_cube
+
+# --- Rollup Cube ---
+# Quantidade sums and row counts over Dia x Responsavel x Status x Inconsistencias,
+# built once per dataset version. Every Dashboard number is answered from it.
+CUBE_DIMENSIONS = ['Dia', 'Responsavel', 'Status', 'Inconsistencias']
+NAT_DAY = np.iinfo(np.int64).min  # Day ordinal for rows without a valid date
+
+_cube_cache = {}  # path -> (version, cube)
+_cube_lock = threading.Lock()
+
+def day_ordinals(dates):
+    """Days since 1970-01-01 as int64 (NaT -> NAT_DAY)."""
+    if not pd.api.types.is_datetime64_dtype(dates):
+        dates = pd.to_datetime(dates)
+    values = np.asarray(dates).astype('datetime64[ns]')
+    ordinals = values.astype('datetime64[D]').astype(np.int64)
+    ordinals[np.isnat(values)] = NAT_DAY
+    return ordinals
+
+def ordinal_to_date(ordinal):
+    return date(1970, 1, 1) + timedelta(days=int(ordinal))
+
+def _codes(values):
+    """
+    Integer codes and the values they stand for, for one cube dimension.
+    Categoricals reuse their own codes and day ordinals become offsets from the
+    first day, so both stay in sorted order; NaN/NaT get a code too.
+    """
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+        n = len(values.cat.categories)
+        codes = values.cat.codes.to_numpy().astype(np.int64)
+        codes[codes < 0] = n
+        uniques = pd.Categorical.from_codes(np.r_[np.arange(n), -1], dtype=values.dtype)
+        return codes, uniques
+    values = np.asarray(values)
+    if values.dtype == np.int64:
+        valid = values != NAT_DAY
+        if not valid.any():
+            return np.zeros(len(values), dtype=np.int64), np.array([NAT_DAY])
+        first, last = values[valid].min(), values[valid].max()
+        codes = np.where(valid, values - first + 1, 0)  # NaT sorts first, as in the date index
+        return codes, np.r_[NAT_DAY, np.arange(first, last + 1)]
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return codes.astype(np.int64), uniques
+
+def _combine_codes(code_arrays, sizes):
+    """Mixed-radix key of several code arrays (first array most significant)."""
+    key = np.zeros(len(code_arrays[0]), dtype=np.int64)
+    for codes, size in zip(code_arrays, sizes):
+        key = key * size + codes
+    return key
+
+# Dense accumulators are used while the full key space stays this small
+DENSE_KEY_LIMIT = 1 << 22
+
+def _accumulate(key, key_space, weights_list):
+    """(distinct keys, one sum per weights array) via bincount."""
+    if key_space > max(DENSE_KEY_LIMIT, 4 * len(key)):
+        # Sparse key space: compact it to the keys that occur first
+        keys, key = np.unique(key, return_inverse=True)
+        key_space = len(keys)
+        counts = np.bincount(key, minlength=key_space)
+        present = slice(None)
+    else:
+        counts = np.bincount(key, minlength=key_space)
+        keys = present = np.flatnonzero(counts)
+    # weights=None means "count the rows"
+    return keys, [counts[present] if w is None else np.bincount(key, weights=w, minlength=key_space)[present]
+                  for w in weights_list]
+
+def build_cube(df):
+    """
+    Aggregates a ledger frame into the rollup cube, sorted by day. One pass of
+    integer codes + bincount over the rows; no per-group work.
+    """
+    dims = [c for c in CUBE_DIMENSIONS if c in df.columns]
+    if 'Quantidade' in df.columns:
+        volume = pd.to_numeric(df['Quantidade'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    else:
+        volume = np.zeros(len(df))
+
+    if not dims:
+        return pd.DataFrame({'Volume': [volume.sum()], 'Registros': [len(df)]})
+
+    code_arrays, uniques = [], []
+    for col in dims:
+        values = day_ordinals(df[col]) if col == 'Dia' else df[col]
+        codes, values_seen = _codes(values)
+        code_arrays.append(codes)
+        uniques.append(values_seen)
+    sizes = [max(len(u), 1) for u in uniques]
+
+    key = _combine_codes(code_arrays, sizes)
+    keys, (volume_sums, record_sums) = _accumulate(key, int(np.prod(sizes, dtype=np.float64)), [volume, None])
+
+    cube = {}
+    for col, size, values_seen in zip(reversed(dims), reversed(sizes), reversed(uniques)):
+        keys, codes = np.divmod(keys, size)
+        cube[col] = values_seen.take(codes)
+    cube = pd.DataFrame({col: cube[col] for col in dims})
+    cube['Volume'] = volume_sums
+    cube['Registros'] = record_sums.astype(np.int64)
+    return cube
+
+def get_cube(file_path):
+    """Rollup cube for file_path, rebuilt only when the dataset version changes."""
+    use_engine = engine_enabled(file_path)
+    version = data_version(file_path)
+    key = os.path.abspath(file_path)
+    with _cube_lock:
+        cached = _cube_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    if use_engine:
+        # GROUP BY runs in DuckDB over the Parquet file, only the cells come back
+        cube = query_cube(file_path, CUBE_DIMENSIONS, NAT_DAY)
+    else:
+        df = load_data(file_path, columns=['Dia', 'Quantidade', 'Inconsistencias', 'Status', 'Responsavel'])
+        if df is None:
+            return None
+        cube = build_cube(df)
+    with _cube_lock:
+        _cube_cache[key] = (version, cube)
+    return cube
+
+def merge_cubes(parts):
+    """Sums the cells of several cubes (dimensions missing from any part are summed over)."""
+    if len(parts) == 1:
+        return parts[0]
+    dims = [c for c in CUBE_DIMENSIONS if all(c in part.columns for part in parts)]
+    if not dims:
+        return pd.concat(parts)[['Volume', 'Registros']].sum().to_frame().T
+
+    # Categories may differ between parts, compare the plain values
+    parts = [part[dims + ['Volume', 'Registros']].astype({c: object for c in dims if c != 'Dia'}) for part in parts]
+    merged = pd.concat(parts, ignore_index=True)
+    merged = merged.groupby(dims, dropna=False, sort=True)[['Volume', 'Registros']].sum().reset_index()
+    return merged[merged['Registros'] != 0].reset_index(drop=True)
+
+def apply_cube_delta(cube, removed_rows=None, added_rows=None):
+    """
+    Updates a cube with the rows an edit removed/added (an update is both).
+    Cost depends on the cube and the change size, not on the dataset.
+    """
+    parts = [cube]
+    if added_rows is not None and len(added_rows):
+        parts.append(build_cube(added_rows))
+    if removed_rows is not None and len(removed_rows):
+        removed = build_cube(removed_rows)
+        removed[['Volume', 'Registros']] = -removed[['Volume', 'Registros']]
+        parts.append(removed)
+    return merge_cubes(parts)
+
+def _on_dataset_change(file_path, old_version, new_version, removed_rows, added_rows):
+    # Roll a cached cube forward by the edit's delta (lazy rebuild otherwise)
+    with _cube_lock:
+        cached = _cube_cache.get(file_path)
+        if cached is None or cached[0] != old_version:
+            return
+        if new_version is None:
+            del _cube_cache[file_path]
+            return
+        _cube_cache[file_path] = (new_version, apply_cube_delta(cached[1], removed_rows, added_rows))
+
+register_change_listener(_on_dataset_change)
+
+def verify_cube(file_path):
+    """
+    Debug check: compares the (incrementally maintained) cached cube with a
+    full recompute. Returns the differing cells (empty when consistent).
+    """
+    cube = get_cube(file_path)
+    df = load_data(file_path, columns=['Dia', 'Quantidade', 'Inconsistencias', 'Status', 'Responsavel'])
+    fresh = build_cube(df)
+    dims = [c for c in CUBE_DIMENSIONS if c in fresh.columns]
+    left = cube.astype({c: object for c in dims if c != 'Dia'})
+    right = fresh.astype({c: object for c in dims if c != 'Dia'})
+    diff = left.merge(right, on=dims, how='outer', suffixes=('_cache', '_completo'), indicator=True)
+    mismatch = (
+        (diff['_merge'] != 'both')
+        | ~np.isclose(diff['Volume_cache'], diff['Volume_completo'])
+        | (diff['Registros_cache'] != diff['Registros_completo'])
+    )
+    return diff[mismatch].drop(columns='_merge')
+
+def date_bounds(cube):
+    """(min, max) date in the cube (sorted by day, so O(log n)), or None without a valid Dia."""
+    if 'Dia' not in cube.columns or len(cube) == 0:
+        return None
+    days = cube['Dia'].to_numpy()
+    first = np.searchsorted(days, NAT_DAY, side='right')  # NaT cells sort first
+    if first >= len(days):
+        return None
+    return ordinal_to_date(days[first]), ordinal_to_date(days[-1])
+
+def _to_ordinal(value):
+    return int((np.datetime64(value, 'D') - np.datetime64('1970-01-01', 'D')).astype(np.int64))
+
+def filter_cube(cube, start_date=None, end_date=None, responsavel=None):
+    """Cube cells inside [start_date, end_date] and for one Responsável ('Todos' = all)."""
+    if 'Dia' in cube.columns and start_date is not None and end_date is not None:
+        # Cube is sorted by day: the period is a contiguous slice
+        days = cube['Dia'].to_numpy()
+        lo = np.searchsorted(days, _to_ordinal(start_date), side='left')
+        hi = np.searchsorted(days, _to_ordinal(end_date), side='right')
+        cube = cube.iloc[lo:hi]
+    if responsavel and responsavel != 'Todos' and 'Responsavel' in cube.columns:
+        cube = cube[cube['Responsavel'] == responsavel]
+    return cube
+
+def summarize_cube(cube):
+    """
+    Every Dashboard KPI and chart series of a (filtered) cube, accumulated with
+    bincount over integer codes of the cells; no intermediate frame copies.
+    """
+    volume = cube['Volume'].to_numpy(dtype='float64')
+    records = cube['Registros'].to_numpy(dtype='float64')
+    total_recs = int(records.sum())
+    summary = {
+        "total_recs": total_recs,
+        "total_qtd": float(volume.sum()),
+        "pending_count": 0,
+        "efficiency": 0,
+        "series": {},
+    }
+
+    codes = {col: _codes(cube[col]) for col in ['Status', 'Inconsistencias', 'Responsavel'] if col in cube.columns}
+
+    def series(cols):
+        arrays = [codes[c][0] for c in cols]
+        sizes = [max(len(codes[c][1]), 1) for c in cols]
+        keys, (sums,) = _accumulate(_combine_codes(arrays, sizes), int(np.prod(sizes, dtype=np.float64)), [volume])
+        out = {}
+        for col, size in zip(reversed(cols), reversed(sizes)):
+            keys, col_codes = np.divmod(keys, size)
+            out[col] = codes[col][1].take(col_codes)
+        frame = pd.DataFrame({col: out[col] for col in cols})
+        frame['Volume'] = sums
+        return frame.dropna().reset_index(drop=True)
+
+    if 'Status' in codes:
+        status_codes, statuses = codes['Status']
+        per_status = np.bincount(status_codes, weights=records, minlength=len(statuses))
+        by_name = dict(zip(statuses, per_status))
+        summary["pending_count"] = int(by_name.get('Pendente', 0))
+        resolved_count = int(by_name.get('Resolvido', 0))
+        summary["efficiency"] = (resolved_count / total_recs) * 100 if total_recs > 0 else 0
+        summary["series"]['Status'] = series(['Status'])
+    if 'Inconsistencias' in codes:
+        summary["series"]['Inconsistencias'] = series(['Inconsistencias'])
+    if 'Responsavel' in codes:
+        stack_by = ('Responsavel', 'Status') if 'Status' in codes else ('Responsavel',)
+        summary["series"]['Responsavel'] = series(list(stack_by))
+    return summary
+
+# --- Dataset Partitions ---
+# Several history files read as one table (e.g. one spreadsheet per month).
+# Partitions outside the period are pruned from their Dia bounds before
+# anything is loaded; the rest are loaded in parallel, each cube cached per
+# file version, so only partitions that changed are read again.
+PARTITION_WORKERS = 4
+
+_partition_bounds_cache = {}  # path -> (version, bounds)
+_dataset_cube_cache = {}  # ((path, version), ...) -> merged cube (last dataset only)
+
+def partition_date_bounds(file_path):
+    """
+    (min, max) Dia of one partition, from the Parquet footer when possible.
+    Pending journal edits only widen the footer range with the days they
+    write: after deletes or updates it can be wider than the data, never narrower.
+    """
+    version = data_version(file_path)
+    key = os.path.abspath(file_path)
+    cached = _partition_bounds_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    bounds = parquet_column_bounds(file_path, 'Dia')
+    if bounds is not None:
+        days = [pd.to_datetime(v, errors='coerce') for v in journal_column_values(file_path, 'Dia')]
+        days = [d for d in days if not pd.isna(d)]
+        low, high = pd.Timestamp(bounds[0]), pd.Timestamp(bounds[1])
+        if days:
+            low, high = min([low] + days), max([high] + days)
+        bounds = (low.date(), high.date())
+    else:
+        # No usable statistics (pending journal edits, csv/xlsx): ask the cube
+        cube = get_cube(file_path)
+        bounds = date_bounds(cube) if cube is not None else None
+    _partition_bounds_cache[key] = (version, bounds)
+    return bounds
+
+def dataset_date_range(paths):
+    """(min, max) Dia over all partitions, or None if none has dates."""
+    bounds = [b for b in (partition_date_bounds(p) for p in paths) if b is not None]
+    if not bounds:
+        return None
+    return min(b[0] for b in bounds), max(b[1] for b in bounds)
+
+def prune_partitions(paths, start_date=None, end_date=None):
+    """Partitions whose Dia range overlaps [start_date, end_date] (all without a period)."""
+    if start_date is None or end_date is None:
+        return list(paths)
+    kept = []
+    for path in paths:
+        bounds = partition_date_bounds(path)
+        if bounds is None or (bounds[0] <= end_date and bounds[1] >= start_date):
+            kept.append(path)
+    return kept
+
+def dataset_version(paths):
+    return tuple((os.path.abspath(p), data_version(p)) for p in paths)
+
+def get_dataset_cube(paths):
+    """Merged rollup cube of the given partitions (None if none could be loaded)."""
+    if not paths:
+        return None
+    key = dataset_version(paths)
+    cached = _dataset_cube_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if len(paths) == 1:
+        cubes = [get_cube(paths[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(PARTITION_WORKERS, len(paths))) as pool:
+            cubes = list(pool.map(get_cube, paths))
+    cubes = [c for c in cubes if c is not None]
+    if not cubes:
+        return None
+    cube = merge_cubes(cubes)
+    _dataset_cube_cache.clear()
+    _dataset_cube_cache[key] = cube
+    return cube
+
+# --- Time Buckets ---
+# The daily chart is grouped into weeks/months/quarters when one bar per day
+# would not fit the chart width; line mode thins long series with LTTB.
+TIME_BUCKETS = ['Dia', 'Semana', 'Mês', 'Trimestre']
+_BUCKET_DAYS = {'Dia': 1, 'Semana': 7, 'Mês': 30.44, 'Trimestre': 91.31}
+MIN_BAR_PX = 8  # Narrowest bar still readable
+
+def choose_bucket(start_date, end_date, width_px):
+    """Finest bucket whose bar count over the period fits width_px."""
+    span = (end_date - start_date).days + 1
+    max_bars = max(width_px // MIN_BAR_PX, 1)
+    for bucket in TIME_BUCKETS:
+        if span / _BUCKET_DAYS[bucket] <= max_bars:
+            return bucket
+    return TIME_BUCKETS[-1]
+
+def bucket_ordinals(days, bucket):
+    """Day ordinal of the first day of each day's bucket (weeks start on Monday)."""
+    if bucket == 'Semana':
+        return days - (days + 3) % 7  # 1970-01-01 was a Thursday
+    if bucket in ('Mês', 'Trimestre'):
+        months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        if bucket == 'Trimestre':
+            months = months - months % 3
+        return months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    return days
+
+def bucket_series(cube, bucket):
+    """Volume per bucket of the (filtered) cube, labelled by the bucket's first day."""
+    days = cube['Dia'].to_numpy()
+    valid = days != NAT_DAY
+    keys = bucket_ordinals(days[valid], bucket)
+    starts, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=cube['Volume'].to_numpy(dtype='float64')[valid], minlength=len(starts))
+    return pd.DataFrame({'Dia': [ordinal_to_date(d) for d in starts], 'Volume': sums})
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: positions of `threshold` points that keep
+    the visual shape of the (x, y) line. All positions if already short enough.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # Point of this bucket forming the largest triangle with the last pick and the next bucket's mean
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def downsample_series(series, max_points):
+    """Keeps at most max_points rows of a Dia/Volume series, chosen by LTTB."""
+    if len(series) <= max_points:
+        return series
+    x = np.array([d.toordinal() for d in series['Dia']], dtype='float64')
+    return series.iloc[lttb(x, series['Volume'].to_numpy(), max_points)]
+
+# --- Date Index ---
+# Row positions of the loaded dataset ordered by Dia, so a period filter on the
+# raw rows is two binary searches and a slice instead of a full date comparison.
+_date_index_cache = {}  # path -> (version, sorted_days, order)
+
+def get_date_index(file_path):
+    """(sorted day ordinals, row positions in that order) for the current version."""
+    version = data_version(file_path)
+    key = os.path.abspath(file_path)
+    cached = _date_index_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    df = load_data(file_path, columns=['Dia'])
+    if df is None or 'Dia' not in df.columns:
+        return None
+    days = day_ordinals(df['Dia'])
+    order = np.argsort(days, kind='stable')
+    sorted_days = days[order]
+    _date_index_cache.clear()  # Only the active dataset is worth keeping
+    _date_index_cache[key] = (version, sorted_days, order)
+    return sorted_days, order
+
+def rows_in_period(file_path, start_date, end_date):
+    """
+    Row positions (in load_data order) with Dia inside [start_date, end_date],
+    as a view on the index, sorted by day. None if the file has no Dia.
+    """
+    index = get_date_index(file_path)
+    if index is None:
+        return None
+    sorted_days, order = index
+    lo = np.searchsorted(sorted_days, _to_ordinal(start_date), side='left')
+    hi = np.searchsorted(sorted_days, _to_ordinal(end_date), side='right')
+    return order[lo:hi]
+
+def dataset_date_bounds(file_path):
+    """(min, max) Dia of the dataset straight from the date index."""
+    index = get_date_index(file_path)
+    if index is None:
+        return None
+    sorted_days = index[0]
+    first = np.searchsorted(sorted_days, NAT_DAY, side='right')
+    if first >= len(sorted_days):
+        return None
+    return ordinal_to_date(sorted_days[first]), ordinal_to_date(sorted_days[-1])
+
+# --- Figure Cache ---
+# Built Plotly figures keyed by (dataset, version, filters, chart id), shared by
+# every session, so unchanged charts are not rebuilt on reruns or navigation.
+FIGURE_CACHE_SIZE = 64
+
+_figure_cache = OrderedDict()
+_figure_lock = threading.Lock()
+
+def cached_figure(key, build):
+    """Returns the cached figure for key, calling build() only on a miss."""
+    with _figure_lock:
+        fig = _figure_cache.get(key)
+        if fig is not None:
+            _figure_cache.move_to_end(key)
+            return fig
+    fig = build()
+    with _figure_lock:
+        _figure_cache[key] = fig
+        while len(_figure_cache) > FIGURE_CACHE_SIZE:
+            _figure_cache.popitem(last=False)
+    return fig
@@ -1,5 +1,38 @@
 import streamlit as st
 import os
+from keystore import ACCESS_KEYS_FILE, key_digest, digest_status
+
+LOGIN_ERRORS = {
+    "invalid": "Chave de acesso inválida.",
+    "expired": "Chave de acesso expirada. Solicite uma nova ao administrador.",
+    "revoked": "Chave de acesso revogada.",
+}
+
+def validate_key(input_key):
+    """True if input_key is a valid, unexpired and not revoked key of access_keys.txt."""
+    try:
+        digest = key_digest(input_key, ACCESS_KEYS_FILE)
+        status = digest_status(digest, ACCESS_KEYS_FILE)
+    except FileNotFoundError:
+        st.toast("Arquivo de chaves (access_keys.txt) não encontrado.", icon="❌")
+        return False
+    st.session_state["login_error"] = LOGIN_ERRORS.get(status)
+    if status == "valid":
+        # Kept (hashed) so a revoked or expired key also ends open sessions
+        st.session_state["key_digest"] = digest
+    return status == "valid"
+
+def session_key_valid():
+    """Re-checks the logged-in key; cheap since the store is cached until the file changes."""
+    digest = st.session_state.get("key_digest")
+    if digest is None:
+        return True
+    try:
+        status = digest_status(digest, ACCESS_KEYS_FILE)
+    except FileNotFoundError:
+        return False
+    st.session_state["login_error"] = LOGIN_ERRORS.get(status)
+    return status == "valid"
 
 def check_password():
     """Returns True if the user had a correct password."""
@@ -12,16 +45,6 @@ def check_password():
         else:
             st.session_state["password_correct"] = False
 
-    def validate_key(input_key):
-        try:
-            # Check against access_keys.txt
-            with open("access_keys.txt", "r") as f:
-                allowed_list = [line.strip() for line in f.readlines() if line.strip() and not line.startswith("#")]
-            return input_key.strip() in allowed_list
-        except FileNotFoundError:
-            st.toast("Arquivo de chaves (access_keys.txt) não encontrado.", icon="❌")
-            return False
-
     if "password_correct" not in st.session_state:
         # First run, show input
         show_login_form(password_entered)
@@ -30,9 +53,17 @@ def check_password():
     elif not st.session_state["password_correct"]:
         # Password incorrect, show input + error
         show_login_form(password_entered)
-        st.toast("Chave de acesso inválida.", icon="❌")
+        st.toast(st.session_state.get("login_error") or LOGIN_ERRORS["invalid"], icon="❌")
         return False
         
+    elif not session_key_valid():
+        # Key revoked or expired since login
+        st.session_state["password_correct"] = False
+        del st.session_state["key_digest"]
+        show_login_form(password_entered)
+        st.toast(st.session_state.get("login_error") or LOGIN_ERRORS["invalid"], icon="❌")
+        return False
+
     else:
         # Password correct
         return True
@@ -0,0 +1,83 @@
+"""
+Dashboard aggregation benchmark: the original per-rerun pandas path (copy,
+boolean slices, one materialization per KPI, four groupbys) against the
+bincount cube kernel (build once + filter/summarize per rerun).
+
+    python benchmarks/bench_aggregation.py [rows]
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import apply_schema
+from analytics import build_cube, filter_cube, summarize_cube, bucket_series
+
+REPEAT = 5
+
+def make_ledger(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Dia': pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 3 * 365, rows), unit='D'),
+        'Quantidade': rng.integers(1, 100, rows),
+        'Inconsistencias': rng.choice([f'Erro {i}' for i in range(30)], rows),
+        'Status': rng.choice(['Pendente', 'Resolvido', 'Cancelado'], rows),
+        'Responsavel': rng.choice([f'Pessoa {i}' for i in range(15)], rows),
+    })
+    return apply_schema(df)
+
+def pandas_path(df, start_date, end_date, selected_resp):
+    df_filtered = df.copy()
+    df_filtered = df_filtered[
+        (df_filtered['Dia'].dt.date >= start_date) &
+        (df_filtered['Dia'].dt.date <= end_date)
+    ]
+    df_filtered['Quantidade'] = pd.to_numeric(df_filtered['Quantidade'], errors='coerce').fillna(0)
+    if selected_resp != 'Todos':
+        df_filtered = df_filtered[df_filtered['Responsavel'] == selected_resp]
+
+    total_recs = len(df_filtered)
+    total_qtd = df_filtered['Quantidade'].sum()
+    pending_count = len(df_filtered[df_filtered['Status'] == 'Pendente'])
+    resolved_count = len(df_filtered[df_filtered['Status'] == 'Resolvido'])
+    efficiency = (resolved_count / total_recs) * 100 if total_recs else 0
+
+    df_filtered.groupby(df_filtered['Dia'].dt.date)['Quantidade'].sum()
+    df_filtered.groupby('Status', observed=True)['Quantidade'].sum()
+    df_filtered.groupby('Inconsistencias', observed=True)['Quantidade'].sum()
+    df_filtered.groupby(['Responsavel', 'Status'], observed=True)['Quantidade'].sum()
+    return total_recs, total_qtd, pending_count, efficiency
+
+def kernel_path(cube, start_date, end_date, selected_resp):
+    cube_filtered = filter_cube(cube, start_date, end_date, selected_resp)
+    summary = summarize_cube(cube_filtered)
+    bucket_series(cube_filtered, 'Dia')
+    return summary["total_recs"], summary["total_qtd"], summary["pending_count"], summary["efficiency"]
+
+def best_of(fn, *args):
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df = make_ledger(rows)
+    start_date, end_date = pd.Timestamp('2021-06-01').date(), pd.Timestamp('2023-06-30').date()
+    print(f"{rows:,} linhas")
+
+    build_ms, cube = best_of(build_cube, df)
+    print(f"  Cubo (uma vez por versão): {build_ms:8.1f} ms  ({len(cube):,} células)")
+
+    for resp in ['Todos', 'Pessoa 3']:
+        old_ms, old = best_of(pandas_path, df, start_date, end_date, resp)
+        new_ms, new = best_of(kernel_path, cube, start_date, end_date, resp)
+        assert old[0] == new[0] and old[2] == new[2] and np.isclose(old[1], new[1]), (old, new)
+        print(f"  Responsável={resp}: pandas {old_ms:8.1f} ms | kernel {new_ms:6.1f} ms | {old_ms / new_ms:6.1f}x")
+
+if __name__ == '__main__':
+    main()
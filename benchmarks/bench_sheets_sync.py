@@ -0,0 +1,117 @@
+"""
+Google Sheets push benchmark against the in-process fake API (fake_sheets.py):
+time, API requests and peak Python memory of a first (full) push, a push
+after ~1% of the rows changed and a push with no changes.
+
+The fake applies Google's write quota (60 requests per "minute") with 429s,
+plus a rate of injected 429s; failed pushes are retried like the sync worker
+does (backoff, acknowledged chunks skipped). Time is compressed: a quota
+minute lasts WINDOW seconds here, and the app's pacer is scaled to match.
+
+    python benchmarks/bench_sheets_sync.py [rows,rows,...] [error_rate]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sheets
+from bench_aggregation import make_ledger
+from fake_sheets import FakeSheetsClient
+
+LATENCY = 0.15  # Seconds per request
+CELL_LATENCY = 2e-6  # Seconds per cell sent
+QUOTA = 60  # Requests per window, as the real per-minute quota
+WINDOW = 1.0  # Seconds standing for one minute
+
+def edit(df, fraction=0.01, seed=1):
+    """Changes Status on `fraction` of the rows, drops and appends a tenth of that."""
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    changed = rng.choice(df.index, max(1, int(len(df) * fraction)), replace=False)
+    df.loc[changed, 'Status'] = 'Resolvido'
+    count = max(1, len(changed) // 10)
+    dropped = rng.choice(df.index.difference(changed), count, replace=False)
+    added = df.iloc[:count].set_axis(range(int(df.index.max()) + 1, int(df.index.max()) + 1 + count))
+    return pd.concat([df.drop(index=dropped), added])
+
+def with_retries(call):
+    """Runs call() like sheets._run_job runs a job: retryable errors back off and retry. Returns (result, retries)."""
+    retries = 0
+    while True:
+        try:
+            return call(), retries
+        except Exception as e:
+            retries += 1
+            if not sheets._is_retryable(e) or retries > sheets.SYNC_MAX_ATTEMPTS:
+                raise
+            time.sleep(sheets._backoff(retries) * WINDOW / 60)
+
+def push_with_retries(ws, df):
+    """Full pushes resume after the chunks already acknowledged. Returns the retry count."""
+    done = set()
+    def push():
+        sheets.push_dataframe(ws, df, force_full=bool(done), done_chunks=done, on_chunk=done.add)
+    return with_retries(push)[1]
+
+def scenarios(df):
+    edited = edit(df)
+    return [("completo", df), ("1% alterado", edited), ("sem mudança", edited)]
+
+def run(df, client, check=False):
+    """One pass over the scenarios on a fresh spreadsheet: [(name, seconds, requests, 429s, retries)]."""
+    ws, _ = with_retries(lambda: sheets.open_worksheet(
+        "fake-credentials.json", f"Bench {len(df)}", "bench@example.com", client=client))
+    results = []
+    for name, frame in scenarios(df):
+        before = dict(client.stats)
+        start = time.perf_counter()
+        retries = push_with_retries(ws, frame)
+        elapsed = time.perf_counter() - start
+        stats = {k: client.stats[k] - before[k] for k in before}
+        results.append((name, elapsed, stats["requests"], stats["throttled"] + stats["injected"], retries))
+        if check:
+            expected = [sheets.sheet_header(frame)] + sheets.sheet_rows(frame)
+            assert ws.values() == expected, f"planilha diverge após '{name}'"
+    return results
+
+def peak_memory(df):
+    """Peak traced memory (MB) per scenario; the fake keeps no cell values here."""
+    client = FakeSheetsClient(keep_values=False)
+    ws = sheets.open_worksheet("fake-credentials.json", f"Mem {len(df)}", "bench@example.com", client=client)
+    peaks = []
+    for _, frame in scenarios(df):
+        tracemalloc.start()
+        sheets.push_dataframe(ws, frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+        tracemalloc.stop()
+    return peaks
+
+def main():
+    sizes = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1_000, 10_000, 100_000, 500_000]
+    error_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    sheets.SYNC_STATE_DIR = tempfile.mkdtemp(prefix="sheets_bench_")
+    sheets.REQUESTS_PER_MINUTE = sheets.REQUESTS_PER_MINUTE * 60 / WINDOW
+    print(f"latência {LATENCY * 1000:.0f} ms + {CELL_LATENCY * 1e6:.0f} µs/célula, "
+          f"cota {QUOTA}/min (1 min = {WINDOW:g} s), 429 injetado em {error_rate:.0%} das chamadas")
+    try:
+        for rows in sizes:
+            df = make_ledger(rows)
+            client = FakeSheetsClient(latency=LATENCY, cell_latency=CELL_LATENCY, quota=QUOTA,
+                                      window=WINDOW, error_rate=error_rate, seed=rows)
+            results = run(df, client, check=rows <= 100_000)
+            peaks = peak_memory(df)
+            print(f"{rows:,} linhas")
+            for (name, elapsed, requests, errors, retries), peak in zip(results, peaks):
+                print(f"  {name:<12} {elapsed:7.2f} s | {requests:4d} requisições ({errors} x 429, "
+                      f"{retries} nova(s) tentativa(s)) | pico {peak:7.1f} MB")
+    finally:
+        shutil.rmtree(sheets.SYNC_STATE_DIR, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+"Puxar da Nuvem" check against the in-process fake API (fake_sheets.py):
+push a small ledger, edit the sheet as a collaborator would, pull, and
+compare the local dataset with what is expected.
+
+    python benchmarks/check_sheets_pull.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sheets
+from utils import create_working_copy, load_data, append_journal
+from fake_sheets import FakeSheetsClient
+
+def make_dataset(folder):
+    source = os.path.join(folder, "ledger.csv")
+    pd.DataFrame({
+        'Dia': ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04'],
+        'Responsavel': ['Ana', 'Bia', 'Caio', 'Duda'],
+        'Status': ['Pendente'] * 4,
+        'Quantidade': [1, 2, 3, 4],
+    }).to_csv(source, index=False)
+    return create_working_copy(source)
+
+def column_index(ws, name):
+    return ws.values()[0].index(name)
+
+def set_cell(ws, row_id_position, column, value):
+    """Collaborator edit of data row `row_id_position` (0-based) of the sheet."""
+    col = column_index(ws, column) + 1
+    ws.update(values=[[value]], range_name=sheets._a1(row_id_position + 2, col))
+
+def check(label, condition):
+    print(f"  {'ok ' if condition else 'FALHOU'} {label}")
+    if not condition:
+        raise SystemExit(1)
+
+def main():
+    folder = tempfile.mkdtemp(prefix="sheets_pull_")
+    sheets.SYNC_STATE_DIR = os.path.join(folder, "sheets_sync")
+    try:
+        file_path = make_dataset(folder)
+        client = FakeSheetsClient()
+        ws = sheets.open_worksheet("fake-credentials.json", "Pull", "eu@example.com", client=client)
+        sheets.push_dataframe(ws, load_data(file_path), source=file_path)
+
+        print("Planilha sem alterações")
+        sheets.pull_worksheet(ws, file_path)  # First pull learns the revision
+        before = client.stats["requests"]
+        result = sheets.pull_worksheet(ws, file_path)
+        check("não baixa a planilha de novo", result["mode"] == "unchanged" and client.stats["requests"] - before == 1)
+
+        print("Exclusão local + edição de outra linha na planilha")
+        append_journal(file_path, [{"op": "delete", "ids": [3]}])
+        set_cell(ws, 1, 'Status', 'Resolvido')
+        result = sheets.pull_worksheet(ws, file_path)
+        df = load_data(file_path)
+        check("a edição da planilha chega ao arquivo local", df.loc[1, 'Status'] == 'Resolvido')
+        check("a linha excluída localmente não volta", 3 not in df.index and result["appended"] == 0)
+        check("só a linha alterada vira operação", result["updated"] == 1 and result["deleted"] == 0)
+
+        print("Linha nova e linha excluída na planilha")
+        ws.append_rows([['2024-01-05', 'Eva', 'Pendente', '5']], table_range="A1")
+        ws.spreadsheet.batch_update({"requests": [{"deleteDimension": {"range": {
+            "sheetId": ws.id, "dimension": "ROWS", "startIndex": 1, "endIndex": 2}}}]})
+        result = sheets.pull_worksheet(ws, file_path)
+        df = load_data(file_path)
+        check("a linha nova é inserida", result["appended"] == 1 and (df['Responsavel'] == 'Eva').sum() == 1)
+        check("a linha excluída na planilha sai do arquivo local", 0 not in df.index and result["deleted"] == 1)
+
+        print("Edição na planilha de uma linha excluída localmente")
+        append_journal(file_path, [{"op": "delete", "ids": [2]}])
+        caio = [row[column_index(ws, 'Responsavel')] for row in ws.values()[1:]].index('Caio')
+        set_cell(ws, caio, 'Quantidade', '30')
+        result = sheets.pull_worksheet(ws, file_path)
+        df = load_data(file_path)
+        check("volta como linha nova com o valor da planilha",
+              result["appended"] == 1 and df.loc[df['Responsavel'] == 'Caio', 'Quantidade'].tolist() == [30])
+
+        print("Envio com a planilha alterada por outra pessoa")
+        sheets.push_dataframe(ws, load_data(file_path), source=file_path)
+        first = ws.values()[1][column_index(ws, 'Responsavel')]
+        ws.spreadsheet.batch_update({"requests": [{"deleteDimension": {"range": {
+            "sheetId": ws.id, "dimension": "ROWS", "startIndex": 1, "endIndex": 2}}}]})
+        second = load_data(file_path).index[1]
+        append_journal(file_path, [{"op": "delete", "ids": [int(second)]}])
+        before = ws.values()
+        try:
+            sheets.push_dataframe(ws, load_data(file_path), source=file_path)
+            refused = False
+        except ValueError:
+            refused = True
+        check("o envio é recusado sem tocar a planilha", refused and ws.values() == before)
+        sheets.pull_worksheet(ws, file_path)
+        check("a exclusão feita na planilha chega ao arquivo local",
+              first not in load_data(file_path)['Responsavel'].astype(str).tolist())
+
+        print("Envio depois da importação")
+        sheets.push_dataframe(ws, load_data(file_path), source=file_path)
+        names = sorted(row[column_index(ws, 'Responsavel')] for row in ws.values()[1:])
+        check("planilha e arquivo local coincidem", names == sorted(load_data(file_path)['Responsavel'].astype(str)))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+In-process stand-in for the part of the Google Sheets/Drive API used by
+sheets.py (gspread's Client, Spreadsheet and Worksheet methods): open,
+open_by_key, create, share, get_worksheet, clear, resize, update,
+batch_update, append_rows, get_all_values and get_lastUpdateTime.
+
+Every call counts as one request and can be slowed down (fixed latency plus
+a per-cell cost), rate limited (requests per window, answered with 429 like
+the real quota) or failed on purpose (injected 429s). Errors carry
+`response.status_code`, so sheets._is_retryable treats them as the real ones.
+
+    client = FakeSheetsClient(latency=0.1, quota=60, error_rate=0.02)
+    ws = sheets.open_worksheet("fake.json", "Ocorrências", "eu@x.com", client=client)
+"""
+import re
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+from gspread.exceptions import SpreadsheetNotFound
+
+CELL_LIMIT = 10_000_000  # Per spreadsheet, as in Google Sheets
+
+class FakeAPIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"[{status}] {message}")
+        self.response = SimpleNamespace(status_code=status)
+
+def _parse_a1(ref):
+    """(row, col), 1-based, of an A1 reference such as "B12"."""
+    match = re.fullmatch(r"([A-Z]*)(\d+)", ref)
+    letters, row = match.group(1) or "A", int(match.group(2))
+    col = 0
+    for ch in letters:
+        col = col * 26 + ord(ch) - 64
+    return row, col
+
+class FakeSheetsClient:
+    """
+    latency: seconds per request; cell_latency: extra seconds per cell sent.
+    quota: requests allowed per `window` seconds (0 = unlimited).
+    error_rate: probability of an injected 429 per request.
+    keep_values: store the cells (False keeps only the shape, for memory runs).
+    """
+    def __init__(self, latency=0.0, cell_latency=0.0, quota=0, window=60.0,
+                 error_rate=0.0, keep_values=True, seed=0):
+        self.latency = latency
+        self.cell_latency = cell_latency
+        self.quota = quota
+        self.window = window
+        self.error_rate = error_rate
+        self.keep_values = keep_values
+        self.stats = {"requests": 0, "throttled": 0, "injected": 0, "cells": 0}
+        self._recent = deque()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._spreadsheets = {}  # id -> FakeSpreadsheet
+
+    def request(self, cells=0):
+        """Accounts for one API call: quota, injected errors, then latency."""
+        with self._lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= self.window:
+                self._recent.popleft()
+            if self.quota and len(self._recent) >= self.quota:
+                self.stats["throttled"] += 1
+                raise FakeAPIError(429, "Quota exceeded for 'Write requests per minute per user'")
+            self._recent.append(now)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats["injected"] += 1
+                raise FakeAPIError(429, "Rate limit exceeded (injected)")
+            self.stats["cells"] += cells
+        time.sleep(self.latency + self.cell_latency * cells)
+
+    # --- Client ---
+    def open(self, title):
+        self.request()
+        for sh in self._spreadsheets.values():
+            if sh.title == title:
+                return sh
+        raise SpreadsheetNotFound(title)
+
+    def open_by_key(self, key):
+        self.request()
+        if key not in self._spreadsheets:
+            raise SpreadsheetNotFound(key)
+        return self._spreadsheets[key]
+
+    def create(self, title):
+        self.request()
+        sh = FakeSpreadsheet(self, uuid.uuid4().hex, title)
+        self._spreadsheets[sh.id] = sh
+        return sh
+
+    def get_file_drive_metadata(self, key):
+        self.request()
+        return {"modifiedTime": self._spreadsheets[key].modified_time()}
+
+class FakeSpreadsheet:
+    def __init__(self, client, key, title):
+        self.client = client
+        self.id = key
+        self.title = title
+        self.permissions = []
+        self.revision = 0
+        self.worksheets = [FakeWorksheet(self, 0)]
+
+    def touch(self):
+        self.revision += 1
+
+    def modified_time(self):
+        return f"rev-{self.revision}"
+
+    def share(self, email, perm_type="user", role="writer"):
+        self.client.request()
+        self.permissions.append((email, perm_type, role))
+
+    def get_worksheet(self, index):
+        self.client.request()
+        return self.worksheets[index]
+
+    def get_lastUpdateTime(self):
+        return self.client.get_file_drive_metadata(self.id)["modifiedTime"]
+
+    def batch_update(self, body):
+        # Only the structural request sheets.py sends: deleteDimension on rows
+        self.client.request()
+        for req in body["requests"]:
+            rng = req["deleteDimension"]["range"]
+            ws = self.worksheets[rng["sheetId"]]
+            ws.delete_rows(rng["startIndex"], rng["endIndex"])
+        self.touch()
+
+    def cell_count(self):
+        return sum(ws.rows * ws.cols for ws in self.worksheets)
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, sheet_id, rows=1000, cols=26):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.rows, self.cols = rows, cols
+        self.grid = []  # Rows of cell strings, up to the last written one (keep_values only)
+        self._lock = threading.Lock()  # Chunks arrive from several threads
+
+    @property
+    def client(self):
+        return self.spreadsheet.client
+
+    def _check_size(self, rows, cols):
+        others = self.spreadsheet.cell_count() - self.rows * self.cols
+        if others + rows * cols > CELL_LIMIT:
+            raise FakeAPIError(400, "This action would increase the number of cells in the workbook above the limit of 10000000 cells.")
+
+    def _write(self, row0, values, col0=0):
+        if self.client.keep_values:
+            values = [[str(v) for v in row] for row in values]
+            with self._lock:
+                if len(self.grid) < row0 + len(values):
+                    self.grid += [[] for _ in range(row0 + len(values) - len(self.grid))]
+                if col0 == 0:
+                    # Whole rows (what sheets.py sends): replace them in one go
+                    self.grid[row0:row0 + len(values)] = [
+                        row + old[len(row):] for row, old in zip(values, self.grid[row0:row0 + len(values)])
+                    ]
+                    return
+                for k, row in enumerate(values):
+                    old = self.grid[row0 + k] + [""] * max(0, col0 - len(self.grid[row0 + k]))
+                    self.grid[row0 + k] = old[:col0] + row + old[col0 + len(row):]
+
+    def delete_rows(self, start, end):
+        count = end - start
+        del self.grid[start:end]
+        self.rows -= count
+
+    def clear(self):
+        self.client.request()
+        self.grid = []
+        self.spreadsheet.touch()
+
+    def resize(self, rows=None, cols=None):
+        rows, cols = rows or self.rows, cols or self.cols
+        self._check_size(rows, cols)
+        self.client.request()
+        self.grid = [row[:cols] for row in self.grid[:rows]]
+        self.rows, self.cols = rows, cols
+        self.spreadsheet.touch()
+
+    def update(self, values, range_name="A1", **kwargs):
+        values = list(values)
+        cells = sum(len(row) for row in values)
+        self.client.request(cells)
+        row, col = _parse_a1(range_name.split("!")[-1].split(":")[0])
+        if row - 1 + len(values) > self.rows:
+            raise FakeAPIError(400, f"Range {range_name} exceeds grid limits. Max rows: {self.rows}")
+        self._write(row - 1, values, col - 1)
+        self.spreadsheet.touch()
+        return {"updatedCells": cells}
+
+    def batch_update(self, data, **kwargs):
+        cells = sum(len(row) for item in data for row in item["values"])
+        self.client.request(cells)
+        for item in data:
+            row, col = _parse_a1(item["range"].split(":")[0])
+            self._write(row - 1, item["values"], col - 1)
+        self.spreadsheet.touch()
+        return {"totalUpdatedCells": cells}
+
+    def append_rows(self, values, table_range=None, **kwargs):
+        values = list(values)
+        cells = sum(len(row) for row in values)
+        self._check_size(self.rows + len(values), self.cols)
+        self.client.request(cells)
+        # Appends go after the last non-empty row, growing the grid when needed
+        last = len(self.grid) if self.client.keep_values else self.rows
+        self._write(last, values)
+        self.rows = max(self.rows, last + len(values))
+        self.spreadsheet.touch()
+        return {"updates": {"updatedCells": cells}}
+
+    def get_all_values(self):
+        self.client.request()
+        return self.values()
+
+    def values(self):
+        """Current cells, padded to a rectangle, without going through the API."""
+        width = max((len(row) for row in self.grid), default=0)
+        return [(row + [""] * width)[:width] for row in self.grid]
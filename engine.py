@@ -0,0 +1,245 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from utils import HAS_PARQUET, apply_schema, _apply_ops, data_version, journal_path, load_settings
+from search_index import normalize_text
+
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+
+if HAS_PARQUET:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+# --- Query Engine ---
+# Optional DuckDB backend: filters, search and the Dashboard groupby run as
+# queries over the Parquet working copy, and pandas only receives the page or
+# the aggregate being shown. Selected in Configurações (settings key "engine").
+ENGINES = {
+    "pandas": "Pandas (em memória)",
+    "duckdb": "DuckDB (consultas no arquivo)",
+}
+
+_local = threading.local()  # One DuckDB connection per thread
+
+def active_engine():
+    engine = load_settings().get("engine", "pandas")
+    if engine == "duckdb" and not HAS_DUCKDB:
+        return "pandas"
+    return engine if engine in ENGINES else "pandas"
+
+def _id_column(file_path):
+    """Parquet column holding the row ids (the DataFrame index), or None."""
+    try:
+        meta = pq.read_schema(file_path).pandas_metadata or {}
+    except Exception:
+        return None
+    index_columns = [c for c in meta.get("index_columns", []) if isinstance(c, str)]
+    return index_columns[0] if len(index_columns) == 1 else None
+
+def engine_enabled(file_path):
+    """True when file_path should be queried with DuckDB instead of pandas."""
+    if active_engine() != "duckdb" or not file_path or not file_path.endswith(".parquet"):
+        return False
+    return _id_column(file_path) is not None
+
+def _connection():
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = _local.con = duckdb.connect()
+    return con
+
+def _parquet(file_path):
+    return "read_parquet('{}')".format(os.path.abspath(file_path).replace("'", "''"))
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+# Pending journal edits are not folded into the file before querying (that
+# rewrites the whole file on every save). Instead the rows they touch are
+# replayed once per version and laid over the Parquet base: queries read
+# base rows minus the touched ids, plus the current state of those ids.
+_overlays = {}  # path -> (version, touched ids, rows)
+_overlay_lock = threading.Lock()
+
+def _select_ids(relation, id_col, ids):
+    con = _connection()
+    if len(ids) == 0:
+        return con.execute(f"SELECT * FROM {relation} LIMIT 0").df()
+    con.register("wanted_ids", pd.DataFrame({"id": ids}))
+    try:
+        # The BETWEEN lets DuckDB skip row groups outside the range from their statistics
+        return con.execute(
+            f"SELECT * FROM {relation} WHERE {id_col} BETWEEN ? AND ? "
+            f"AND {id_col} IN (SELECT id FROM wanted_ids) ORDER BY {id_col}",
+            [int(ids.min()), int(ids.max())],
+        ).df()
+    finally:
+        con.unregister("wanted_ids")
+
+def _journal_overlay(file_path):
+    """(touched ids, their current rows as a flat frame) for the pending journal, or None."""
+    jpath = journal_path(file_path)
+    if not os.path.exists(jpath):
+        return None
+    key = os.path.abspath(file_path)
+    version = data_version(file_path)  # Taken first: a concurrent append only makes it stale
+    with _overlay_lock:
+        cached = _overlays.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1:]
+
+    with open(jpath, "r", encoding="utf-8") as f:
+        ops = [json.loads(line) for line in f if line.strip()]
+    touched = np.unique(np.asarray([row_id for op in ops for row_id in op.get("ids", [])], dtype=np.int64))
+    id_name = _id_column(file_path)
+    base = _select_ids(_parquet(file_path), _quote(id_name), touched).set_index(id_name)
+    base.index.name = None
+    rows = _apply_ops(apply_schema(base), ops)
+    rows = rows.loc[rows.index.intersection(touched)]
+    # Plain columns for DuckDB (categories would become ENUMs)
+    rows = rows.astype({c: object for c in rows.columns if isinstance(rows[c].dtype, pd.CategoricalDtype)})
+    rows = rows.rename_axis(id_name).reset_index()
+    with _overlay_lock:
+        _overlays[key] = (version, touched, rows)
+    return touched, rows
+
+def _source(file_path):
+    """FROM clause for the dataset: the Parquet file with the pending journal applied."""
+    overlay = _journal_overlay(file_path)
+    if overlay is None:
+        return _parquet(file_path)
+    touched, rows = overlay
+    name = "journal_" + hashlib.md5(os.path.abspath(file_path).encode()).hexdigest()[:12]
+    con = _connection()
+    con.register(f"{name}_ids", pd.DataFrame({"id": touched}))
+    con.register(f"{name}_rows", rows)
+    id_col = _quote(_id_column(file_path))
+    return (
+        f"(SELECT * FROM {_parquet(file_path)} WHERE {id_col} NOT IN (SELECT id FROM {name}_ids) "
+        f"UNION ALL BY NAME SELECT * FROM {name}_rows) AS dataset"
+    )
+
+def dataset_columns(file_path):
+    """Data columns of the working copy (row id column excluded)."""
+    id_col = _id_column(file_path)
+    return [c for c in pq.read_schema(file_path).names if c != id_col]
+
+def distinct_values(file_path, column):
+    if column not in dataset_columns(file_path):
+        return []
+    sql = f"SELECT DISTINCT {_quote(column)} FROM {_source(file_path)} WHERE {_quote(column)} IS NOT NULL"
+    return [row[0] for row in _connection().execute(sql).fetchall()]
+
+def query_row_ids(file_path, search=None, responsavel=None, status=None, inconsistencias=None, period=None):
+    """
+    Row ids (in file order) matching the Editor filters. `search` is matched
+    case and accent insensitively against every column, dates also as DD/MM/YYYY.
+    """
+    columns = dataset_columns(file_path)
+    id_col = _quote(_id_column(file_path))
+    where, params = [], []
+
+    if period and len(period) == 2 and 'Dia' in columns:
+        where.append('CAST("Dia" AS DATE) BETWEEN ? AND ?')
+        params += [period[0], period[1]]
+    for col, values in (('Responsavel', responsavel), ('Status', status), ('Inconsistencias', inconsistencias)):
+        if values and col in columns:
+            where.append(f"{_quote(col)} IN ({', '.join('?' * len(values))})")
+            params += [str(v) for v in values]
+    if search:
+        texts = []
+        for col in columns:
+            if col == 'Dia':
+                texts += ["strftime(\"Dia\", '%Y-%m-%d')", "strftime(\"Dia\", '%d/%m/%Y')"]
+            else:
+                texts.append(f"CAST({_quote(col)} AS VARCHAR)")
+        matches = [f"contains(strip_accents(lower(coalesce({t}, ''))), ?)" for t in texts]
+        where.append("(" + " OR ".join(matches) + ")")
+        params += [normalize_text(search.strip())] * len(matches)
+
+    sql = f"SELECT {id_col} FROM {_source(file_path)}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {id_col}"
+    result = _connection().execute(sql, params).fetchnumpy()
+    return np.asarray(next(iter(result.values())), dtype=np.int64)
+
+def fetch_rows(file_path, ids):
+    """The rows with the given ids, as a schema-typed frame indexed by row id."""
+    id_name = _id_column(file_path)
+    df = _select_ids(_source(file_path), _quote(id_name), np.asarray(ids, dtype=np.int64))
+    df = df.set_index(id_name)
+    df.index.name = None
+    return apply_schema(df)
+
+def query_cube(file_path, dimensions, nat_day):
+    """
+    Rollup cube (same layout as analytics.build_cube) computed by DuckDB:
+    only the grouped cells reach pandas.
+    """
+    columns = dataset_columns(file_path)
+    dims = [c for c in dimensions if c in columns]
+    select = []
+    for col in dims:
+        if col == 'Dia':
+            select.append("date_diff('day', DATE '1970-01-01', CAST(\"Dia\" AS DATE)) AS \"Dia\"")
+        else:
+            select.append(f"CAST({_quote(col)} AS VARCHAR) AS {_quote(col)}")
+    volume = "TRY_CAST(\"Quantidade\" AS DOUBLE)" if 'Quantidade' in columns else "0"
+    select += [f"coalesce(SUM({volume}), 0) AS \"Volume\"", "COUNT(*) AS \"Registros\""]
+
+    sql = f"SELECT {', '.join(select)} FROM {_source(file_path)}"
+    if dims:
+        positions = [str(i + 1) for i in range(len(dims))]
+        sql += f" GROUP BY {', '.join(positions)} ORDER BY {', '.join(p + ' NULLS FIRST' for p in positions)}"
+    cube = _connection().execute(sql).df()
+    if 'Dia' in cube.columns:
+        days = cube['Dia']
+        cube['Dia'] = np.where(days.isna(), nat_day, days.fillna(0).astype(np.int64))
+    cube['Volume'] = cube['Volume'].astype('float64')
+    cube['Registros'] = cube['Registros'].astype(np.int64)
+    return cube
+
+# --- Whole-Dataset Reads ---
+# Compaction and export need every row. In DuckDB mode they stream them out
+# of the query (base + journal overlay, in id order) in record batches, so
+# the dataset never has to fit in the Streamlit process at once.
+BATCH_ROWS = 100_000
+
+def _tables(file_path, batch_rows, metadata=None):
+    """Ordered batches cast to the base file's schema (pandas metadata included)."""
+    schema = pq.read_schema(file_path)
+    schema = schema.with_metadata({**(schema.metadata or {}), **(metadata or {})})
+    id_col = _quote(_id_column(file_path))
+    reader = _connection().execute(f"SELECT * FROM {_source(file_path)} ORDER BY {id_col}").fetch_record_batch(batch_rows)
+    batches = 0
+    for batch in reader:
+        batches += 1
+        yield pa.Table.from_batches([batch]).select(schema.names).cast(schema)
+    if not batches:
+        yield schema.empty_table()  # Still one table, for the header
+
+def iter_dataset(file_path, batch_rows=BATCH_ROWS):
+    """The dataset in id order, as schema-typed frames (indexed by row id) of up to batch_rows rows."""
+    for table in _tables(file_path, batch_rows):
+        # The pandas metadata restores the row id index and the nullable types, as read_parquet does
+        yield apply_schema(table.to_pandas())
+
+def write_parquet(file_path, out_path, metadata=None, batch_rows=BATCH_ROWS):
+    """
+    Writes the dataset (pending journal applied) to out_path with the schema of
+    the base file, pandas metadata included, plus the extra schema `metadata`.
+    """
+    tables = _tables(file_path, batch_rows, metadata)
+    first = next(tables)
+    with pq.ParquetWriter(out_path, first.schema) as writer:
+        writer.write_table(first)
+        for table in tables:
+            writer.write_table(table)
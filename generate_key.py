@@ -1,32 +1,56 @@
 import secrets
 import string
+from datetime import date, timedelta
+from keystore import ACCESS_KEYS_FILE, add_keys, revoke_key, hash_legacy_keys
 
 def generate_key(length=16):
     """Gera uma chave segura no formato XXXX-XXXX-XXXX-XXXX"""
     alphabet = string.ascii_uppercase + string.digits
     raw_key = ''.join(secrets.choice(alphabet) for _ in range(length))
-    
+
     # Formata em blocos de 4
     formatted_key = '-'.join(raw_key[i:i+4] for i in range(0, length, 4))
     return formatted_key
 
-if __name__ == "__main__":
-    print("=== Gerador de Chaves de Acesso ===")
+def generate_menu():
     qtd = input("Quantas chaves deseja gerar? (Enter para 1): ")
     qtd = int(qtd) if qtd.isdigit() else 1
-    
+
     new_keys = []
     print("\nChaves Geradas:")
     for _ in range(qtd):
         key = generate_key()
         print(f"🔑 {key}")
         new_keys.append(key)
-        
-    save = input("\nDeseja salvar essas chaves no arquivo 'access_keys.txt'? (S/N): ").upper()
+    print("⚠️ Anote as chaves agora: o arquivo guarda apenas o hash delas.")
+
+    save = input(f"\nDeseja salvar essas chaves no arquivo '{ACCESS_KEYS_FILE}'? (S/N): ").upper()
     if save == 'S':
-        with open("access_keys.txt", "a") as f:
-            for k in new_keys:
-                f.write(f"{k}\n")
-        print("✅ Chaves salvas com sucesso!")
-    
+        days = input("Validade em dias (Enter para sem validade): ")
+        expires = date.today() + timedelta(days=int(days)) if days.isdigit() else None
+        label = input("Identificação (opcional, ex.: nome ou setor): ").strip()
+        add_keys(new_keys, expires=expires, label=label)
+        print("✅ Chaves salvas com sucesso!" + (f" Válidas até {expires:%d/%m/%Y}." if expires else ""))
+
+def revoke_menu():
+    key = input("Chave a revogar: ").strip()
+    if key and revoke_key(key):
+        print("✅ Chave revogada.")
+    else:
+        print("❌ Chave não encontrada.")
+
+if __name__ == "__main__":
+    print("=== Gerador de Chaves de Acesso ===")
+    print("1 - Gerar chaves")
+    print("2 - Revogar uma chave")
+    print("3 - Converter chaves em texto puro para hash")
+    option = input("Opção (Enter para 1): ").strip() or "1"
+
+    if option == "2":
+        revoke_menu()
+    elif option == "3":
+        print(f"✅ {hash_legacy_keys()} chave(s) convertida(s).")
+    else:
+        generate_menu()
+
     input("\nPressione Enter para sair...")
@@ -0,0 +1,164 @@
+import os
+import hmac
+import hashlib
+import secrets
+import threading
+from datetime import date
+
+# --- Access Key Store ---
+# access_keys.txt keeps HMAC-SHA256 digests of the keys, never the keys:
+#   # salt: 3f9a...                      (store-wide salt, written once)
+#   hmac-sha256:<hex> expires=2026-12-31 label=Financeiro
+#   hmac-sha256:<hex> revoked
+# Lines without the prefix are legacy plaintext keys and are still accepted.
+# The file is parsed once into a dict keyed by digest and only re-read when
+# its mtime/size change, so a login costs one HMAC and one lookup.
+ACCESS_KEYS_FILE = "access_keys.txt"
+HASH_PREFIX = "hmac-sha256:"
+SALT_HEADER = "# salt:"
+
+_store = {"signature": None, "salt": None, "keys": {}}
+_store_lock = threading.Lock()
+_fallback_salt = secrets.token_bytes(16)  # Hashes legacy keys when the file has no salt yet
+
+def hash_key(key, salt):
+    return hmac.new(salt, key.strip().encode("utf-8"), hashlib.sha256).hexdigest()
+
+def read_salt(lines):
+    for line in lines:
+        if line.startswith(SALT_HEADER):
+            return bytes.fromhex(line[len(SALT_HEADER):].strip())
+    return None
+
+def parse_entry(line, salt):
+    """(digest, metadata) of a key line, or None for blanks/comments/unusable lines."""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if not line.startswith(HASH_PREFIX):
+        # Legacy plaintext key: the whole line is the key
+        return hash_key(line, salt or _fallback_salt), {"expires": None, "revoked": False, "label": "", "legacy": True}
+    if salt is None:
+        return None  # Hashes can't be checked without the salt they were made with
+
+    fields = line.split()
+    meta = {"expires": None, "revoked": False, "label": "", "legacy": False}
+    for field in fields[1:]:
+        name, _, value = field.partition("=")
+        if name == "expires":
+            try:
+                meta["expires"] = date.fromisoformat(value)
+            except ValueError:
+                meta["revoked"] = True  # Unreadable expiry: refuse rather than never expire
+        elif name == "revoked":
+            meta["revoked"] = True
+        elif name == "label":
+            meta["label"] = value
+    return fields[0][len(HASH_PREFIX):].lower(), meta
+
+def load_key_store(path=ACCESS_KEYS_FILE):
+    """Parsed store {"salt", "keys": {digest: metadata}}, re-read only when the file changes."""
+    stat = os.stat(path)  # FileNotFoundError is for the caller
+    signature = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _store_lock:
+        if _store["signature"] == signature:
+            return _store
+
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        salt = read_salt(lines)
+        keys = {}
+        for line in lines:
+            entry = parse_entry(line, salt)
+            if entry is not None:
+                keys[entry[0]] = entry[1]
+        _store.update(signature=signature, salt=salt or _fallback_salt, keys=keys)
+        return _store
+
+def key_digest(input_key, path=ACCESS_KEYS_FILE):
+    return hash_key(input_key, load_key_store(path)["salt"])
+
+def digest_status(digest, path=ACCESS_KEYS_FILE, today=None):
+    """Status of a key digest: "valid", "invalid", "expired" or "revoked"."""
+    # This lookup is the timing defence: it is keyed by the salted HMAC, so how long
+    # it takes says nothing about the stored keys
+    meta = load_key_store(path)["keys"].get(digest)
+    if meta is None:
+        return "invalid"
+    if meta["revoked"]:
+        return "revoked"
+    if meta["expires"] is not None and meta["expires"] < (today or date.today()):
+        return "expired"
+    return "valid"
+
+def key_status(input_key, path=ACCESS_KEYS_FILE, today=None):
+    """Status of the key typed at login (see digest_status)."""
+    return digest_status(key_digest(input_key, path), path, today)
+
+# --- Maintenance (generate_key.py) ---
+def _read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+def _write_lines(path, lines):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+def ensure_salt(lines):
+    """Salt of the store, adding the header to lines when there is none."""
+    salt = read_salt(lines)
+    if salt is None:
+        salt = secrets.token_bytes(16)
+        lines.insert(0, f"{SALT_HEADER} {salt.hex()}")
+    return salt
+
+def format_entry(digest, expires=None, label="", revoked=False):
+    fields = [HASH_PREFIX + digest]
+    if expires:
+        fields.append(f"expires={expires.isoformat()}")
+    if label:
+        fields.append("label=" + "_".join(label.split()))
+    if revoked:
+        fields.append("revoked")
+    return " ".join(fields)
+
+def add_keys(keys, expires=None, label="", path=ACCESS_KEYS_FILE):
+    """Appends the digests of keys (plaintext is never written)."""
+    lines = _read_lines(path)
+    salt = ensure_salt(lines)
+    lines += [format_entry(hash_key(k, salt), expires, label) for k in keys]
+    _write_lines(path, lines)
+
+def revoke_key(key, path=ACCESS_KEYS_FILE):
+    """Marks key as revoked (legacy plaintext lines become hashed ones). False if not found."""
+    lines = _read_lines(path)
+    salt = ensure_salt(lines)
+    digest = hash_key(key, salt)
+    found = False
+    for i, line in enumerate(lines):
+        entry = parse_entry(line, salt)
+        if entry is not None and hmac.compare_digest(entry[0], digest):
+            meta = entry[1]
+            lines[i] = format_entry(digest, meta["expires"], meta["label"], revoked=True)
+            found = True
+    if found:
+        _write_lines(path, lines)
+    return found
+
+def hash_legacy_keys(path=ACCESS_KEYS_FILE):
+    """Replaces plaintext key lines by their digests. Returns how many were converted."""
+    lines = _read_lines(path)
+    salt = ensure_salt(lines)
+    converted = 0
+    for i, line in enumerate(lines):
+        entry = parse_entry(line, salt)
+        if entry is not None and entry[1]["legacy"]:
+            lines[i] = format_entry(entry[0])
+            converted += 1
+    if converted:
+        _write_lines(path, lines)
+    return converted
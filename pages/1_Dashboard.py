@@ -1,9 +1,12 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-from utils import load_data
+import pandas as pd
+from analytics import (get_dataset_cube, dataset_date_range, prune_partitions, dataset_version, date_bounds, filter_cube, summarize_cube, verify_cube, cached_figure,
+                       TIME_BUCKETS, choose_bucket, bucket_series, downsample_series)
 import os
+import time
 import styles
+from utils import timed, record_timing, show_rerun_timings
 
 st.set_page_config(page_title="Dashboard Contábil", layout="wide")
 
@@ -14,76 +17,76 @@ from auth import require_login
 require_login()
 
 st.title("Visão Geral da Operação")
+page_start = time.perf_counter()
 st.markdown("---")
 
 # --- Session Management ---
-if 'current_file_path' not in st.session_state or not st.session_state['current_file_path']:
-    st.info("Para começar, faça o upload de uma planilha na **Página Inicial** ou selecione um histórico.")
-    st.stop()
-    
-file_path = st.session_state['current_file_path']
-if not os.path.exists(file_path):
-    st.error("Arquivo não encontrado. Por favor, carregue novamente na Home.")
-    st.session_state['current_file_path'] = None
-    st.stop()
-
-df = load_data(file_path)
+# Dataset mode: several history files analysed as partitions of one table
+dataset_paths = [p for p in (st.session_state.get('dataset_paths') or []) if os.path.exists(p)]
 
-if df is None:
-    st.stop()
+if dataset_paths:
+    paths = dataset_paths
+else:
+    if 'current_file_path' not in st.session_state or not st.session_state['current_file_path']:
+        st.info("Para começar, faça o upload de uma planilha na **Página Inicial** ou selecione um histórico.")
+        st.stop()
+        
+    file_path = st.session_state['current_file_path']
+    if not os.path.exists(file_path):
+        st.error("Arquivo não encontrado. Por favor, carregue novamente na Home.")
+        st.session_state['current_file_path'] = None
+        st.stop()
+    paths = [file_path]
 
 # --- Sidebar Filters ---
 with st.sidebar:
     st.header("Filtros de Visualização")
     
-    # Date Range Filter
-    if 'Dia' in df.columns:
-        min_date = df['Dia'].min().date()
-        max_date = df['Dia'].max().date()
+    # Date Range Filter (bounds from partition metadata, nothing loaded yet)
+    bounds = dataset_date_range(paths)
+    date_range = ()
+    if bounds is not None:
+        min_date, max_date = bounds
         date_range = st.date_input(
             "Período",
             value=(min_date, max_date),
             min_value=min_date,
             max_value=max_date
         )
+    start_date, end_date = date_range if len(date_range) == 2 else (None, None)
+
+    # Rollup cube of the partitions overlapping the period (each rebuilt only when its file changes)
+    active_paths = prune_partitions(paths, start_date, end_date) or paths[:1]  # Empty period: any partition gives the empty result
+    cube = get_dataset_cube(active_paths)
+    if cube is None:
+        st.stop()
     
     # Responsible Filter
-    if 'Responsavel' in df.columns:
-        responsaveis = ['Todos'] + sorted(list(df['Responsavel'].unique()))
+    if 'Responsavel' in cube.columns:
+        responsaveis = ['Todos'] + sorted(cube['Responsavel'].dropna().unique().tolist())
     else:
         responsaveis = ['Todos']
         
     selected_resp = st.selectbox("Responsável", responsaveis)
 
+    if dataset_paths:
+        st.markdown("---")
+        st.caption(f"Conjunto de {len(paths)} arquivos · {len(active_paths)} no período")
+        if st.button("Sair do Conjunto", use_container_width=True):
+            st.session_state['dataset_paths'] = None
+            st.rerun()
+
 # --- Filtering Logic ---
-df_filtered = df.copy()
-
-# Date Filter
-if 'Dia' in df.columns and len(date_range) == 2:
-    start_date, end_date = date_range
-    df_filtered = df_filtered[
-        (df_filtered['Dia'].dt.date >= start_date) & 
-        (df_filtered['Dia'].dt.date <= end_date)
-    ]
-
-# Ensure 'Quantidade' is numeric
-if 'Quantidade' in df_filtered.columns:
-    df_filtered['Quantidade'] = pd.to_numeric(df_filtered['Quantidade'], errors='coerce').fillna(0)
-    
-# Responsible Filter
-if selected_resp != 'Todos' and 'Responsavel' in df_filtered.columns:
-    df_filtered = df_filtered[df_filtered['Responsavel'] == selected_resp]
+# Date + Responsible filters applied on the cube cells, not the raw rows
+cube_filtered = filter_cube(cube, start_date, end_date, selected_resp)
 
 # --- KPIs ---
-total_recs = len(df_filtered)
-total_qtd = df_filtered['Quantidade'].sum() if 'Quantidade' in df_filtered.columns and pd.api.types.is_numeric_dtype(df_filtered['Quantidade']) else 0
-pending_count = len(df_filtered[df_filtered['Status'] == 'Pendente']) if 'Status' in df_filtered.columns else 0
-# Calculation of resolution %
-if total_recs > 0:
-    resolved_count = len(df_filtered[df_filtered['Status'] == 'Resolvido'])
-    efficiency = (resolved_count / total_recs) * 100
-else:
-    efficiency = 0
+# One aggregation pass yields every KPI and chart series
+summary = summarize_cube(cube_filtered)
+total_recs = summary["total_recs"]
+total_qtd = summary["total_qtd"]
+pending_count = summary["pending_count"]
+efficiency = summary["efficiency"]
 
 col1, col2, col3, col4 = st.columns(4)
 col1.metric("Registros Totais", total_recs)
@@ -93,67 +96,135 @@ col4.metric("Taxa de Resolução", f"{efficiency:.1f}%")
 
 st.markdown("###") # Spacer
 
-# --- Professional Charts ---
-col_charts_top1, col_charts_top2 = st.columns(2)
+# --- Figure Builders ---
+DAILY_CHART_WIDTH_PX = 640  # Approximate width of the chart in its half-page column
 
-with col_charts_top1:
-    st.subheader("Ocorrências por Dia")
-    if 'Dia' in df_filtered.columns:
-        # Aggregate by day (Sum Quantity)
-        daily_counts = df_filtered.groupby(df_filtered['Dia'].dt.date)['Quantidade'].sum().reset_index(name='Volume')
-        fig_trend = px.bar(daily_counts, x='Dia', y='Volume', template='plotly_dark')
-        fig_trend.update_layout(
-            margin=dict(l=20, r=20, t=10, b=20),
-            height=300
-        )
-        st.plotly_chart(fig_trend, use_container_width=True)
+def build_daily_figure(cube_filtered, bucket, chart_type):
+    # Aggregate by bucket (Sum Quantity)
+    daily_counts = bucket_series(cube_filtered, bucket)
+    if chart_type == 'Linha':
+        # Roughly one point every 2px is all the line can show
+        daily_counts = downsample_series(daily_counts, DAILY_CHART_WIDTH_PX // 2)
+        fig_trend = px.line(daily_counts, x='Dia', y='Volume', template='plotly_dark')
     else:
-        st.warning("Coluna **'Dia'** não encontrada para exibir este gráfico.")
-
-with col_charts_top2:
-    st.subheader("Status Atual")
-    if 'Status' in df_filtered.columns:
-        # Sum by status
-        status_counts = df_filtered.groupby('Status')['Quantidade'].sum().reset_index(name='Volume')
-        
-        fig_donut = px.pie(status_counts, values='Volume', names='Status', hole=0.6, template='plotly_dark')
-        fig_donut.update_layout(
-            margin=dict(l=0, r=0, t=0, b=0),
-            legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5),
-            height=300
-        )
-        st.plotly_chart(fig_donut, use_container_width=True)
-    else:
-        st.warning("Coluna **'Status'** não encontrada.")
-
-col_charts_bot1, col_charts_bot2 = st.columns(2)
-
-with col_charts_bot1:
-    st.subheader("Top Inconsistências")
-    if 'Inconsistencias' in df_filtered.columns:
-        # Sum by Inconsistency
-        inc_counts = df_filtered.groupby('Inconsistencias')['Quantidade'].sum().reset_index(name='Volume')
-        inc_counts = inc_counts.sort_values(by='Volume', ascending=True).tail(5)
-        
-        fig_bar = px.bar(inc_counts, y='Inconsistencias', x='Volume', orientation='h', text='Volume', template='plotly_dark')
-        fig_bar.update_layout(
-            margin=dict(l=0, r=0, t=0, b=0)
-        )
-        st.plotly_chart(fig_bar, use_container_width=True)
-    else:
-        st.warning("Coluna **'Inconsistencias'** não encontrada.")
+        fig_trend = px.bar(daily_counts, x='Dia', y='Volume', template='plotly_dark')
+    fig_trend.update_layout(
+        margin=dict(l=20, r=20, t=10, b=20),
+        height=300
+    )
+    return fig_trend
+
+def build_status_figure(series):
+    # Sum by status
+    status_counts = series['Status']
+
+    fig_donut = px.pie(status_counts, values='Volume', names='Status', hole=0.6, template='plotly_dark')
+    fig_donut.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5),
+        height=300
+    )
+    return fig_donut
+
+def build_inconsistency_figure(series):
+    # Sum by Inconsistency
+    inc_counts = series['Inconsistencias']
+    inc_counts = inc_counts.sort_values(by='Volume', ascending=True).tail(5)
+
+    fig_bar = px.bar(inc_counts, y='Inconsistencias', x='Volume', orientation='h', text='Volume', template='plotly_dark')
+    fig_bar.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0)
+    )
+    return fig_bar
+
+def build_responsible_figure(series):
+    # Stacked bar by status for each responsible (Sum Quantity)
+    resp_status = series['Responsavel']
+
+    fig_stack = px.bar(resp_status, x='Responsavel', y='Volume', color=resp_status.columns[-2], template='plotly_dark')
+    fig_stack.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig_stack
 
-with col_charts_bot2:
-    st.subheader("Produtividade por Responsável")
-    if 'Responsavel' in df_filtered.columns:
-        # Stacked bar by status for each responsible (Sum Quantity)
-        resp_status = df_filtered.groupby(['Responsavel', 'Status'])['Quantidade'].sum().reset_index(name='Volume')
-        
-        fig_stack = px.bar(resp_status, x='Responsavel', y='Volume', color='Status', template='plotly_dark')
-        fig_stack.update_layout(
-            margin=dict(l=0, r=0, t=0, b=0),
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-        )
-        st.plotly_chart(fig_stack, use_container_width=True)
-    else:
-        st.warning("Coluna **'Responsavel'** não encontrada.")
+# --- Professional Charts ---
+# Own fragment: chart interactions don't rerun the filters and KPIs.
+# Figures are reused while the dataset version and filters are unchanged.
+@st.fragment
+@timed("Gráficos")
+def charts_section(cube_filtered, series, fig_key, period):
+    col_charts_top1, col_charts_top2 = st.columns(2)
+
+    with col_charts_top1:
+        st.subheader("Ocorrências por Dia")
+        if 'Dia' in cube_filtered.columns:
+            col_bucket, col_type = st.columns(2)
+            bucket_choice = col_bucket.selectbox("Agrupamento", ['Automático'] + TIME_BUCKETS, key="daily_bucket")
+            chart_type = col_type.radio("Tipo", ['Barras', 'Linha'], horizontal=True, key="daily_chart_type")
+
+            bucket = bucket_choice
+            if bucket_choice == 'Automático':
+                if chart_type == 'Linha':
+                    bucket = 'Dia'  # Long ranges are thinned by LTTB instead
+                else:
+                    if period[0] is None:
+                        period = date_bounds(cube_filtered)
+                    bucket = choose_bucket(*period, DAILY_CHART_WIDTH_PX) if period else 'Dia'
+            if bucket != 'Dia':
+                st.caption(f"Agrupado por {bucket.lower()}")
+
+            fig_trend = cached_figure(fig_key + ('daily', bucket, chart_type),
+                                      lambda: build_daily_figure(cube_filtered, bucket, chart_type))
+            st.plotly_chart(fig_trend, use_container_width=True)
+        else:
+            st.warning("Coluna **'Dia'** não encontrada para exibir este gráfico.")
+
+    with col_charts_top2:
+        st.subheader("Status Atual")
+        if 'Status' in cube_filtered.columns:
+            fig_donut = cached_figure(fig_key + ('status',), lambda: build_status_figure(series))
+            st.plotly_chart(fig_donut, use_container_width=True)
+        else:
+            st.warning("Coluna **'Status'** não encontrada.")
+
+    col_charts_bot1, col_charts_bot2 = st.columns(2)
+
+    with col_charts_bot1:
+        st.subheader("Top Inconsistências")
+        if 'Inconsistencias' in cube_filtered.columns:
+            fig_bar = cached_figure(fig_key + ('inconsistencias',), lambda: build_inconsistency_figure(series))
+            st.plotly_chart(fig_bar, use_container_width=True)
+        else:
+            st.warning("Coluna **'Inconsistencias'** não encontrada.")
+
+    with col_charts_bot2:
+        st.subheader("Produtividade por Responsável")
+        if 'Responsavel' in cube_filtered.columns:
+            fig_stack = cached_figure(fig_key + ('responsavel',), lambda: build_responsible_figure(series))
+            st.plotly_chart(fig_stack, use_container_width=True)
+        else:
+            st.warning("Coluna **'Responsavel'** não encontrada.")
+
+fig_key = (dataset_version(active_paths), start_date, end_date, selected_resp)
+charts_section(cube_filtered, summary["series"], fig_key, (start_date, end_date))
+
+# --- Debug: consistency of the incrementally maintained aggregates ---
+@st.fragment
+def aggregates_debug_section():
+    with st.expander("Depuração dos Agregados"):
+        st.caption(f"Cubo: {len(cube)} combinações · {int(cube['Registros'].sum())} registros")
+        if st.button("Verificar contra recálculo completo"):
+            mismatches = pd.concat([verify_cube(p) for p in active_paths], ignore_index=True)
+            if mismatches.empty:
+                st.success("Agregados consistentes com o recálculo completo.")
+            else:
+                st.error(f"{len(mismatches)} combinação(ões) divergente(s).")
+                st.dataframe(mismatches, use_container_width=True)
+
+if st.query_params.get("debug") == "1":
+    aggregates_debug_section()
+
+record_timing("Página completa", page_start)
+if st.query_params.get("debug") == "1":
+    show_rerun_timings()
@@ -1,10 +1,16 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import time
 from datetime import date
+from functools import partial
 from dateutil.relativedelta import relativedelta
-from utils import load_data, load_options, save_options_file, save_settings, load_settings, SETTINGS_FILE
+from utils import load_data, append_journal, CATEGORY_COLUMNS, timed, record_timing, show_rerun_timings, export_file, export_name, load_options, save_options_file, save_settings, load_settings, SETTINGS_FILE
+from analytics import dataset_date_bounds, rows_in_period, get_date_index, partition_date_bounds
+from engine import engine_enabled, dataset_columns, distinct_values, query_row_ids, fetch_rows
+from search_index import search_rows
+from sheets import enqueue_push, pull_sheet, load_queue, start_sync_worker, reset_client_pool, SYNC_MAX_ATTEMPTS
 import styles
 
 st.set_page_config(page_title="Gestão de Ocorrências", layout="wide")
@@ -13,6 +19,7 @@ from auth import require_login
 require_login()
 
 st.title("Gestão de Ocorrências")
+page_start = time.perf_counter()
 
 
 # --- Session Management ---
@@ -27,24 +34,33 @@ if not os.path.exists(file_path):
     st.stop()
 
 # Load Data
-df = load_data(file_path)
-if df is None:
-    st.stop()
+# With the DuckDB engine the file is queried in place: df only carries the columns
+engine_on = engine_enabled(file_path)
+if engine_on:
+    df = pd.DataFrame(columns=dataset_columns(file_path))
+else:
+    df = load_data(file_path)
+    if df is None:
+        st.stop()
+
+def save_ops(ops):
+    # DuckDB mode reads back only the touched rows, never the whole file
+    append_journal(file_path, ops, read_rows=partial(fetch_rows, file_path) if engine_on else None)
+
+def column_values(col):
+    if col not in df.columns:
+        return []
+    return distinct_values(file_path, col) if engine_on else list(df[col].unique())
 
 # --- Options Management ---
 saved_options = load_options()
-current_resp = list(df['Responsavel'].unique()) if 'Responsavel' in df.columns else []
-current_inc = list(df['Inconsistencias'].unique()) if 'Inconsistencias' in df.columns else []
+current_resp = column_values('Responsavel')
+current_inc = column_values('Inconsistencias')
 
 all_responsaveis = sorted(list(set(saved_options.get("responsavel", []) + current_resp + ["Outro"])))
 all_inconsistencias = sorted(list(set(saved_options.get("inconsistencias", []) + current_inc + ["Outro"])))
 all_status = sorted(list(set(saved_options.get("status", ['Pendente', 'Resolvido', 'Em Análise', 'Cancelado']))))
 
-# --- Data Editor Config ---
-# --- Layout Containers ---
-table_container = st.container()
-bulk_container = st.container()
-
 # --- Data Editor Config ---
 today = date.today()
 min_date = today - relativedelta(years=1) # 1 Year window logic
@@ -111,23 +127,156 @@ def render_filters(df_input):
             f_status = st.multiselect("Status", all_status)
         f_inc = st.multiselect("Inconsistência", all_inconsistencias)
 
+        # Period (bounds come straight from the date index)
+        f_period = ()
+        bounds = None
+        if 'Dia' in df_input.columns:
+            bounds = partition_date_bounds(file_path) if engine_on else dataset_date_bounds(file_path)
+        if bounds is not None:
+            f_period = st.date_input("Período", value=(), min_value=bounds[0], max_value=bounds[1], format="DD/MM/YYYY")
+
 
-        rows_to_show = st.slider("Linhas Visíveis (Rolagem)", min_value=5, max_value=100, value=15, step=5)
+        col_f3, col_f4 = st.columns(2)
+        with col_f3:
+            rows_to_show = st.slider("Linhas Visíveis (Rolagem)", min_value=5, max_value=100, value=15, step=5)
+        with col_f4:
+            page_size = st.selectbox("Linhas por Página", PAGE_SIZES, index=0)
         
     # Apply Logic
-    df_out = df_input.copy()
-    if search_term:
-        mask = df_out.astype(str).apply(lambda x: x.str.contains(search_term, case=False, na=False)).any(axis=1)
-        df_out = df_out[mask]
+    if engine_on:
+        # Filters and search run as one query; only the matching row ids come back
+        ids = query_row_ids(file_path, search_term, f_resp, f_status, f_inc, f_period)
+        df_out = pd.DataFrame(index=pd.Index(ids))
+    else:
+        df_out = df_input
+        if len(f_period) == 2:
+            # Binary search on the date index instead of comparing every row
+            positions = rows_in_period(file_path, f_period[0], f_period[1])
+            if positions is not None and len(get_date_index(file_path)[1]) == len(df_input):
+                df_out = df_input.iloc[np.sort(positions)]
+            else:
+                df_out = df_input[(df_input['Dia'].dt.date >= f_period[0]) & (df_input['Dia'].dt.date <= f_period[1])]
+        if search_term:
+            # Inverted index lookup (built once per dataset version)
+            match_ids = search_rows(file_path, search_term)
+            if match_ids is not None:
+                df_out = df_out[df_out.index.isin(match_ids)]
+            else:
+                mask = df_out.astype(str).apply(lambda x: x.str.contains(search_term, case=False, na=False, regex=False)).any(axis=1)
+                df_out = df_out[mask]
         
-    if f_resp and 'Responsavel' in df_out.columns:
-        df_out = df_out[df_out['Responsavel'].isin(f_resp)]
-    if f_status and 'Status' in df_out.columns:
-        df_out = df_out[df_out['Status'].isin(f_status)]
-    if f_inc and 'Inconsistencias' in df_out.columns:
-        df_out = df_out[df_out['Inconsistencias'].isin(f_inc)]
+        if f_resp and 'Responsavel' in df_out.columns:
+            df_out = df_out[df_out['Responsavel'].isin(f_resp)]
+        if f_status and 'Status' in df_out.columns:
+            df_out = df_out[df_out['Status'].isin(f_status)]
+        if f_inc and 'Inconsistencias' in df_out.columns:
+            df_out = df_out[df_out['Inconsistencias'].isin(f_inc)]
+
+    # Identifies the current result set (pages/widgets reset when it changes)
+    filter_sig = hash((search_term, tuple(f_resp), tuple(f_status), tuple(f_inc), tuple(f_period), page_size))
         
-    return df_out, rows_to_show
+    return df_out, rows_to_show, page_size, filter_sig
+
+# --- Paging Helpers ---
+# Only the current page is copied, converted and sent to the browser.
+PAGE_SIZES = [100, 250, 500, 1000]
+
+def paginate(df_filtered, page_size, filter_sig):
+    """Returns (df_page, page, n_pages) using the pager state in the session."""
+    n_pages = max(1, -(-len(df_filtered) // page_size))
+    if st.session_state.get("editor_filter_sig") != filter_sig:
+        st.session_state["editor_filter_sig"] = filter_sig
+        st.session_state["editor_page"] = 1
+    page = min(max(1, st.session_state.get("editor_page", 1)), n_pages)
+    st.session_state["editor_page"] = page
+    offset = (page - 1) * page_size
+    df_page = df_filtered.iloc[offset:offset + page_size]
+    if engine_on:
+        df_page = fetch_rows(file_path, df_page.index)  # Only this page is read into pandas
+    return df_page, page, n_pages
+
+def render_pager(total_rows, page, n_pages, page_size):
+    col_p1, col_p2 = st.columns([0.7, 0.3], gap="small")
+    with col_p1:
+        first = (page - 1) * page_size + 1 if total_rows else 0
+        last = min(page * page_size, total_rows)
+        st.caption(f"Linhas {first:,}–{last:,} de {total_rows:,} · Página {page} de {n_pages}".replace(",", "."))
+    with col_p2:
+        st.number_input("Página", min_value=1, max_value=n_pages, step=1, key="editor_page", label_visibility="collapsed")
+
+def prepare_view(df_part):
+    # Display types for the grid (done per page, not for the whole dataset)
+    df_view = df_part.copy()
+    if 'Quantidade' in df_view.columns:
+        df_view['Quantidade'] = df_view['Quantidade'].astype(str)
+    if 'Dia' in df_view.columns:
+        df_view['Dia'] = pd.to_datetime(df_view['Dia']).dt.date
+    for col in CATEGORY_COLUMNS:
+        if col in df_view.columns:
+            df_view[col] = df_view[col].astype(object)
+    return df_view
+
+def sync_page_selection(widget_key, page_ids):
+    """on_change callback: merges the page's ticked/unticked boxes into the selected row ids."""
+    selected = set(st.session_state.get("selected_ids", set()))
+    for pos, change in st.session_state[widget_key]["edited_rows"].items():
+        if "Selecionar" in change:
+            if change["Selecionar"]:
+                selected.add(page_ids[int(pos)])
+            else:
+                selected.discard(page_ids[int(pos)])
+    st.session_state["selected_ids"] = selected
+    # Next run draws a fresh grid seeded from selected_ids (these edits are merged now)
+    st.session_state["selection_grid_rev"] = st.session_state.get("selection_grid_rev", 0) + 1
+
+# --- Editor Diff Helper ---
+def collect_editor_changes(view_df, editor_state):
+    """
+    Turns the data editor widget state (edited/added/deleted rows, by
+    position in view_df) into journal ops. Only the touched cells are
+    validated and written. Returns (ops, summary, errors).
+    """
+    errors = []
+
+    def clean(col, value, row_label):
+        if value is None or (isinstance(value, str) and not value.strip()):
+            errors.append(f"{row_label}: '{col}' é obrigatório.")
+            return None
+        if col == 'Quantidade':
+            value = str(value).strip()
+            if not value.isdigit() or len(value) > 5:
+                errors.append(f"{row_label}: Quantidade deve ter até 5 dígitos.")
+                return None
+            return int(value)
+        if col == 'Dia':
+            parsed = pd.to_datetime(value, errors='coerce')
+            if pd.isna(parsed):
+                errors.append(f"{row_label}: data inválida.")
+                return None
+            return parsed
+        return value
+
+    ops = []
+    cells_changed = 0
+    for pos, changes in editor_state.get("edited_rows", {}).items():
+        row_id = view_df.index[int(pos)]
+        values = {col: clean(col, val, f"Linha {int(pos) + 1}") for col, val in changes.items() if col in view_df.columns}
+        if values:
+            ops.append({"op": "update", "ids": [row_id], "values": values})
+            cells_changed += len(values)
+
+    new_rows = []
+    for i, row in enumerate(editor_state.get("added_rows", [])):
+        new_rows.append({col: clean(col, row.get(col), f"Nova linha {i + 1}") for col in view_df.columns})
+    if new_rows:
+        ops.append({"op": "insert", "rows": new_rows})
+
+    deleted_ids = [view_df.index[int(pos)] for pos in editor_state.get("deleted_rows", [])]
+    if deleted_ids:
+        ops.append({"op": "delete", "ids": deleted_ids})
+
+    summary = {"cells": cells_changed, "added": len(new_rows), "deleted": len(deleted_ids)}
+    return ops, summary, errors
 
 @st.dialog("Registrar Ocorrência", width="large")
 def entry_form():
@@ -215,22 +364,8 @@ def entry_form():
                     final_entries = edited_buffer.to_dict('records')
                     df_new = pd.DataFrame(final_entries)
                     
-                    # Append locally to df
-                    for col in df.columns:
-                        if col not in df_new.columns:
-                            df_new[col] = None 
-                    
-                    # Update main DF
-                    updated_df = pd.concat([df, df_new], ignore_index=True)
-                    
-                    # Save to file
-                    if file_path.endswith('.csv'):
-                        updated_df.to_csv(file_path, index=False)
-                    else:
-                        writer_df = updated_df.copy()
-                        if 'Dia' in writer_df.columns:
-                            writer_df['Dia'] = pd.to_datetime(writer_df['Dia']).dt.date
-                        writer_df.to_excel(file_path, index=False)
+                    # Append to the edit journal (new row ids are assigned there)
+                    save_ops([{"op": "insert", "rows": df_new.to_dict('records')}])
                     
                     st.toast(f"{len(df_new)} registros salvos com sucesso!", icon=None)
                     st.session_state["pending_entries"] = [] 
@@ -240,7 +375,10 @@ def entry_form():
                 except Exception as e:
                     st.toast(f"Erro ao salvar: {e}", icon="❌")
 
-with table_container:
+# --- Table Section (filters + grid, reruns on its own) ---
+@st.fragment
+@timed("Tabela e Filtros")
+def table_section():
 
 
     # --- Toolbar (Mode & Add) ---
@@ -260,58 +398,58 @@ with table_container:
         st.info("⚠️ **Modo de Edição em Massa:** Selecione as linhas para edição em massa.")
         
         # Render Filters HERE (Below Balloon)
-        df_filtered, rows_to_show = render_filters(df)
+        df_filtered, rows_to_show, page_size, filter_sig = render_filters(df)
+        df_page, page, n_pages = paginate(df_filtered, page_size, filter_sig)
         
         # Prepare View
-        df_editor_view = df_filtered.copy()
-        if 'Quantidade' in df_editor_view.columns:
-            df_editor_view['Quantidade'] = df_editor_view['Quantidade'].astype(str)
-        if 'Dia' in df_editor_view.columns:
-            df_editor_view['Dia'] = pd.to_datetime(df_editor_view['Dia']).dt.date
-        
-        # Configure columns for View
-        view_config = column_cfg.copy()
-        if "Selecionar" in view_config: del view_config["Selecionar"] # Remove checkbox config if present
+        df_editor_view = prepare_view(df_page)
         
-        event = st.dataframe(
+        # The chosen row ids live in the session; the checkbox column shows them on every page
+        selected_ids = st.session_state.get("selected_ids", set())
+        df_editor_view.insert(0, "Selecionar", df_editor_view.index.isin(list(selected_ids)))
+        grid_key = f"grid_sel_{filter_sig}_{page}_{st.session_state.get('selection_grid_rev', 0)}"
+        st.data_editor(
             df_editor_view,
             use_container_width=True,
-            column_config=view_config,
+            column_config=column_cfg,
+            disabled=[c for c in df_editor_view.columns if c != "Selecionar"],
             height=(rows_to_show * 35) + 38,
-            on_select="rerun",
-            selection_mode="multi-row",
-            hide_index=True
+            on_change=partial(sync_page_selection, grid_key, df_editor_view.index.tolist()),
+            hide_index=True,
+            key=grid_key
         )
+        render_pager(len(df_filtered), page, n_pages, page_size)
         
-        if len(event.selection.rows) > 0:
-            selected_indices = df_editor_view.iloc[event.selection.rows].index
-            
-        edited_df = df_editor_view # For reference in export, though not edited
+        # Selection spans pages; only rows matching the current filters are targeted
+        selected_indices = df_filtered.index.intersection(list(st.session_state.get("selected_ids", set())))
+        
+        edited_df = df_filtered # For reference in export, though not edited
 
     else:
         # CELL EDIT MODE
-        st.warning("⚠️ **Modo de Edição Individual:** Clique no campo para editá-lo.")
+        st.warning("⚠️ **Modo de Edição Individual:** Clique no campo para editá-lo. Salve antes de trocar de página.")
         
         # Render Filters HERE (Below Balloon)
-        df_filtered, rows_to_show = render_filters(df)
+        df_filtered, rows_to_show, page_size, filter_sig = render_filters(df)
+        df_page, page, n_pages = paginate(df_filtered, page_size, filter_sig)
         
         # Prepare View
-        df_editor_view = df_filtered.copy()
-        if 'Quantidade' in df_editor_view.columns:
-            df_editor_view['Quantidade'] = df_editor_view['Quantidade'].astype(str)
-        if 'Dia' in df_editor_view.columns:
-            df_editor_view['Dia'] = pd.to_datetime(df_editor_view['Dia']).dt.date
+        df_editor_view = prepare_view(df_page)
         
         # No 'Selecionar' column in this mode
         
-        edited_df = st.data_editor(
+        editor_key = f"editor_main_{filter_sig}_{page}"
+        st.data_editor(
             df_editor_view,
             use_container_width=True,
             column_config=column_cfg,
             num_rows="dynamic",
-            key="editor_main",
+            key=editor_key,
             height=(rows_to_show * 35) + 38
         )
+        render_pager(len(df_filtered), page, n_pages, page_size)
+        
+        edited_df = df_filtered # Export sends the whole filtered set, not just this page
         
         # No bulk selection in this mode
         selected_indices = []
@@ -321,42 +459,38 @@ with table_container:
     if view_mode == "Modo Individual":
         if st.button("💾 Salvar Alterações Manuais", type="primary", use_container_width=True):
             try:
-                # Prepare processed edited dataframe
-                processed_edited = edited_df.copy()
-                if 'Quantidade' in processed_edited.columns:
-                    processed_edited['Quantidade'] = pd.to_numeric(processed_edited['Quantidade'], errors='ignore')
-                if 'Dia' in processed_edited.columns:
-                    processed_edited['Dia'] = pd.to_datetime(processed_edited['Dia'])
-                    
-                # Update logic:
-                # 1. Update existing rows (intersection of indices)
-                common_indices = processed_edited.index.intersection(df.index)
-                if not common_indices.empty:
-                    df.loc[common_indices] = processed_edited.loc[common_indices]
-                    
-                # 2. Add new rows (indices in edited but not in original)
-                new_indices = processed_edited.index.difference(df.index)
-                if not new_indices.empty:
-                    new_rows = processed_edited.loc[new_indices]
-                    df = pd.concat([df, new_rows])
-                    
-                # Write to disk
-                if file_path.endswith('.csv'):
-                    df.to_csv(file_path, index=False)
+                # Apply only what the editor reports as changed
+                ops, summary, errors = collect_editor_changes(df_editor_view, st.session_state.get(editor_key, {}))
+                if errors:
+                    for err in errors[:5]:
+                        st.toast(err, icon="❌")
+                elif not ops:
+                    st.toast("Nenhuma alteração para salvar.", icon="⚠️")
                 else:
-                    writer_df = df.copy()
-                    if 'Dia' in writer_df.columns:
-                        writer_df['Dia'] = pd.to_datetime(writer_df['Dia']).dt.date
-                    writer_df.to_excel(file_path, index=False)
+                    # Write to the edit journal
+                    save_ops(ops)
+                    # Reset the widget deltas, they are now part of the data
+                    del st.session_state[editor_key]
                     
-                st.toast("Dados salvos com sucesso!", icon="✅")
-                time.sleep(1)
-                st.rerun()
+                    st.toast(
+                        f"Dados salvos: {summary['cells']} célula(s) alterada(s), "
+                        f"{summary['added']} linha(s) adicionada(s), {summary['deleted']} linha(s) excluída(s).",
+                        icon="✅"
+                    )
+                    time.sleep(1)
+                    st.rerun()
             except Exception as e:
                 st.toast(f"Erro ao salvar: {e}", icon="❌")
 
+    # Handed to the export panel (a separate fragment)
+    st.session_state["editor_export_df"] = edited_df
+
+    bulk_section(view_mode, selected_indices)
+
 # --- Bulk Edit Logic (Works for both modes) ---
-with bulk_container:
+@st.fragment
+@timed("Edição em Lote")
+def bulk_section(view_mode, selected_indices):
     if view_mode == "Modo Seleção":
         num_selected = len(selected_indices)
         bulk_label = f"✏️ Edição em Lote ({num_selected} Selecionados)" if num_selected > 0 else "✏️ Edição em Lote"
@@ -364,6 +498,12 @@ with bulk_container:
         with st.expander(bulk_label, expanded=(num_selected > 0)):
             
             if num_selected > 0:
+                col_s1, col_s2 = st.columns([0.75, 0.25], gap="small")
+                col_s1.caption("A seleção vale para todas as páginas do filtro atual.")
+                if col_s2.button("Limpar Seleção", use_container_width=True):
+                    st.session_state["selected_ids"] = set()
+                    st.rerun()
+
                 c_bulk_1, c_bulk_2, c_bulk_3 = st.columns(3)
                 
                 with c_bulk_1:
@@ -383,28 +523,20 @@ with bulk_container:
                 with col_b1:
                     if st.button(f"Aplicar aos {num_selected} selecionados", type="primary", use_container_width=True):
                         try:
-                            # Apply changes directly to Main DF based on selected_indices
-                            updates_made = False
+                            # Collect the changed fields for the selected row ids
+                            new_values = {}
                             
                             if use_resp:
-                                df.loc[selected_indices, 'Responsavel'] = val_resp
-                                updates_made = True
+                                new_values['Responsavel'] = val_resp
                             if use_stat:
-                                df.loc[selected_indices, 'Status'] = val_stat
-                                updates_made = True
+                                new_values['Status'] = val_stat
                             if use_inc:
-                                df.loc[selected_indices, 'Inconsistencias'] = val_inc
-                                updates_made = True
+                                new_values['Inconsistencias'] = val_inc
                                 
-                            if updates_made:
+                            if new_values:
                                 # Save logic
-                                if file_path.endswith('.csv'):
-                                    df.to_csv(file_path, index=False)
-                                else:
-                                    writer_df = df.copy()
-                                    if 'Dia' in writer_df.columns:
-                                        writer_df['Dia'] = pd.to_datetime(writer_df['Dia']).dt.date
-                                    writer_df.to_excel(file_path, index=False)
+                                save_ops([{"op": "update", "ids": list(selected_indices), "values": new_values}])
+                                st.session_state["selected_ids"] = set()
                                     
                                 st.toast(f"{num_selected} registros atualizados com sucesso!", icon="✅")
                                 time.sleep(1)
@@ -417,16 +549,9 @@ with bulk_container:
                 with col_b2:
                     if st.button(f"🗑️ Excluir", type="secondary", use_container_width=True):
                          try:
-                            df.drop(selected_indices, inplace=True)
-                            
                             # Save logic
-                            if file_path.endswith('.csv'):
-                                df.to_csv(file_path, index=False)
-                            else:
-                                writer_df = df.copy()
-                                if 'Dia' in writer_df.columns:
-                                    writer_df['Dia'] = pd.to_datetime(writer_df['Dia']).dt.date
-                                writer_df.to_excel(file_path, index=False)
+                            save_ops([{"op": "delete", "ids": list(selected_indices)}])
+                            st.session_state["selected_ids"] = set()
                             
                             st.toast(f"{num_selected} registros excluídos!", icon="✅")
                             time.sleep(1)
@@ -435,147 +560,224 @@ with bulk_container:
                             st.toast(f"Erro ao excluir: {e}", icon="❌")
                         
             else:
-                st.write("Clique nas linhas da tabela acima para selecionar.")
-
-
-# --- Export Section ---
+                st.write("Marque a coluna \"Selecionar\" na tabela acima para selecionar linhas.")
 
 
+table_section()
 
-col_dl, col_gs = st.columns([1, 1], gap="medium")
 
-# --- Column 1: Local & Help ---
-with col_dl:
-    with st.container(border=True):
-        st.subheader("Local e Ajuda")
+# --- Export Section ---
+@st.fragment
+@timed("Exportação")
+def export_section():
+    col_dl, col_gs = st.columns([1, 1], gap="medium")
+
+    # --- Column 1: Local & Help ---
+    with col_dl:
+        with st.container(border=True):
+            st.subheader("Local e Ajuda")
         
-        with open(file_path, "rb") as f:
-            file_data = f.read()
-                
-        file_name = os.path.basename(file_path)
-        clean_name = file_name.split("_", 1)[-1] if "_" in file_name else file_name
-        mime_type = "text/csv" if file_name.endswith(".csv") else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            clean_name = export_name(file_path)
+            mime_type = "text/csv" if clean_name.endswith(".csv") else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         
-        st.download_button(
-            label="Baixar Arquivo Atualizado",
-            data=file_data,
-            file_name=f"EDITADO_{clean_name}",
-            mime=mime_type,
-            use_container_width=True
-        )
-
-
-        st.subheader("Central de Ajuda")
-
-        with st.expander("Como Configurar o \"Robô\" do Google (Google Sheets API)"):
-            st.markdown("""
-            Para usar o botão **"Enviar para Google Sheets"**, você precisa de um arquivo `credentials.json` gratuito.
-
-            1. Acesse o **[Google Cloud Console](https://console.cloud.google.com/)**.
-            2. Na barra azul do topo, clique no nome do projeto atual e depois em **"Novo Projeto"**. Dê o nome de *Dashboard Contabil*.
-            3. Vá no menu **APIs e Serviços > Biblioteca**.
-            4. Pesquise e ative duas APIs (uma de cada vez):
-               - **Google Sheets API**
-               - **Google Drive API** (Essencial para contornar erros de cota).
-            5. Vá em **APIs e Serviços > Credenciais**.
-            6. Clique em **Criar Credenciais > Conta de Serviço**.
-            7. Dê um nome (ex: `robo-planilha`) e clique em **Criar e Continuar**.
-            8. Pode pular as etapas opcionais clicando em **Concluir**.
-            9. Na lista de contas, clique no e-mail do robô recém-criado (ex: `robo-planilha@...iam.gserviceaccount.com`).
-            10. Vá na aba **Chaves** > **Adicionar Chave** > **Criar nova chave** > **JSON**.
-            11. O download começará. **Renomeie esse arquivo para `credentials.json`** e coloque na pasta do projeto (ou faça upload pelo painel).
-            """)
-
-        with st.expander("Solução de Erros Comuns"):
-            st.markdown("""
-            **Erro 403: "Storage quota exceeded"**
-            Geralmente é falta de permissão.
-            1. Crie uma planilha no **seu** Google Planilhas.
-            2. Compartilhe com o **e-mail do robô** (veja no arquivo JSON).
-            3. No painel ao lado, use o **mesmo nome** da planilha.
-
-            **"Não salvou no meu PC"**
-            O navegador não edita seu arquivo local (`C:\...`).
-            - Use o botão **"Baixar Arquivo Atualizado"** acima para salvar uma cópia.
-            """)
-
-        with st.expander("Dicas de Uso e Atalhos"):
-            st.markdown("""
-            **Atalhos do Editor**
-            - **Enter**: Salva e vai para a linha de baixo.
-            - **Delete**: Limpa a célula selecionada.
-            - **Duplo Clique**: Edita a célula (Texto/Número).
-
-            **� Regras para Manter o Layout**
-            - **Datas**: Permitido até **1 ano atrás** (Evite datas muito antigas).
-            - **Quantidade**: Máximo de **5 dígitos** (99.999).
-            - **Textos**: Use nomes curtos em "Responsável" e "Status" para evitar que a tabela fique muito larga.
-            """)
-
-# --- Column 2: Google Sheets ---
-with col_gs:
-    with st.container(border=True):
-        st.subheader("Google Sheets")
+            st.download_button(
+                label="Baixar Arquivo Atualizado",
+                # xlsx/csv is only built when clicked, the working copy stays columnar
+                data=partial(export_file, file_path),
+                file_name=f"EDITADO_{clean_name}",
+                mime=mime_type,
+                use_container_width=True
+            )
+
+
+            st.subheader("Central de Ajuda")
+
+            with st.expander("Como Configurar o \"Robô\" do Google (Google Sheets API)"):
+                st.markdown("""
+                Para usar o botão **"Enviar para Google Sheets"**, você precisa de um arquivo `credentials.json` gratuito.
+
+                1. Acesse o **[Google Cloud Console](https://console.cloud.google.com/)**.
+                2. Na barra azul do topo, clique no nome do projeto atual e depois em **"Novo Projeto"**. Dê o nome de *Dashboard Contabil*.
+                3. Vá no menu **APIs e Serviços > Biblioteca**.
+                4. Pesquise e ative duas APIs (uma de cada vez):
+                   - **Google Sheets API**
+                   - **Google Drive API** (Essencial para contornar erros de cota).
+                5. Vá em **APIs e Serviços > Credenciais**.
+                6. Clique em **Criar Credenciais > Conta de Serviço**.
+                7. Dê um nome (ex: `robo-planilha`) e clique em **Criar e Continuar**.
+                8. Pode pular as etapas opcionais clicando em **Concluir**.
+                9. Na lista de contas, clique no e-mail do robô recém-criado (ex: `robo-planilha@...iam.gserviceaccount.com`).
+                10. Vá na aba **Chaves** > **Adicionar Chave** > **Criar nova chave** > **JSON**.
+                11. O download começará. **Renomeie esse arquivo para `credentials.json`** e coloque na pasta do projeto (ou faça upload pelo painel).
+                """)
+
+            with st.expander("Solução de Erros Comuns"):
+                st.markdown("""
+                **Erro 403: "Storage quota exceeded"**
+                Geralmente é falta de permissão.
+                1. Crie uma planilha no **seu** Google Planilhas.
+                2. Compartilhe com o **e-mail do robô** (veja no arquivo JSON).
+                3. No painel ao lado, use o **mesmo nome** da planilha.
+
+                **"Não salvou no meu PC"**
+                O navegador não edita seu arquivo local (`C:\...`).
+                - Use o botão **"Baixar Arquivo Atualizado"** acima para salvar uma cópia.
+                """)
+
+            with st.expander("Dicas de Uso e Atalhos"):
+                st.markdown("""
+                **Atalhos do Editor**
+                - **Enter**: Salva e vai para a linha de baixo.
+                - **Delete**: Limpa a célula selecionada.
+                - **Duplo Clique**: Edita a célula (Texto/Número).
+
+                **� Regras para Manter o Layout**
+                - **Datas**: Permitido até **1 ano atrás** (Evite datas muito antigas).
+                - **Quantidade**: Máximo de **5 dígitos** (99.999).
+                - **Textos**: Use nomes curtos em "Responsável" e "Status" para evitar que a tabela fique muito larga.
+                """)
+
+    # --- Column 2: Google Sheets ---
+    with col_gs:
+        with st.container(border=True):
+            st.subheader("Google Sheets")
         
-        creds_file = "credentials.json"
-        if not os.path.exists(creds_file):
-            st.warning("Arquivo de credenciais (`.json`) não encontrado.")
-            uploaded_creds = st.file_uploader("Faça upload do arquivo de chaves do Google (JSON)", type="json", key="creds_up")
-            if uploaded_creds is not None:
-                with open(creds_file, "wb") as f:
-                    f.write(uploaded_creds.getbuffer())
-                st.success("Credenciais salvas! Recarregando...")
-                time.sleep(1)
-                st.rerun()
-        else:
-            st.success("Credenciais (`credentials.json`) detectadas.")
-            
-            with st.expander("Trocar Arquivo de Credenciais"):
-                 started_creds = st.file_uploader("Substituir arquivo JSON", type="json", key="creds_replace")
-                 if started_creds is not None:
+            creds_file = "credentials.json"
+            if not os.path.exists(creds_file):
+                st.warning("Arquivo de credenciais (`.json`) não encontrado.")
+                uploaded_creds = st.file_uploader("Faça upload do arquivo de chaves do Google (JSON)", type="json", key="creds_up")
+                if uploaded_creds is not None:
                     with open(creds_file, "wb") as f:
-                        f.write(started_creds.getbuffer())
-                    st.success("Credenciais atualizadas! Recarregando...")
+                        f.write(uploaded_creds.getbuffer())
+                    reset_client_pool()
+                    st.success("Credenciais salvas! Recarregando...")
                     time.sleep(1)
                     st.rerun()
+            else:
+                st.success("Credenciais (`credentials.json`) detectadas.")
+            
+                with st.expander("Trocar Arquivo de Credenciais"):
+                     started_creds = st.file_uploader("Substituir arquivo JSON", type="json", key="creds_replace")
+                     # The uploader keeps the file across reruns: replace it only once per upload
+                     if started_creds is not None and st.session_state.get("creds_upload_id") != started_creds.file_id:
+                        st.session_state["creds_upload_id"] = started_creds.file_id
+                        with open(creds_file, "wb") as f:
+                            f.write(started_creds.getbuffer())
+                        reset_client_pool()
+                        st.success("Credenciais atualizadas! Recarregando...")
+                        time.sleep(1)
+                        st.rerun()
+
+                saved_settings = load_settings()
+                default_sheet = saved_settings.get("sheet_name", "")
+                default_email = saved_settings.get("email_share", "")
+
+                sheet_name = st.text_input("Nome da Planilha (Google Sheets)", value=default_sheet)
+                email_share = st.text_input("Seu E-mail Google", value=default_email)
+            
+                force_full = st.checkbox(
+                    "Reenviar tudo (ressincronização completa)",
+                    help="Ignora o último envio e regrava a planilha inteira, descartando o que foi alterado diretamente no Google Sheets. Sem esta opção, um envio para uma planilha alterada por outra pessoa é recusado até você usar \"Puxar da Nuvem\"."
+                )
+                split = st.checkbox(
+                    "Dividir por mês quando exceder o limite de células",
+                    help="O Google Sheets aceita até 10 milhões de células por planilha. Acima disso, cria uma planilha por mês (\"Nome AAAA-MM\")."
+                )
+            
+                col_push, col_pull = st.columns(2)
+                if col_pull.button("Puxar da Nuvem", use_container_width=True, help="Traz para o arquivo local as linhas alteradas na planilha por outras pessoas."):
+                    if not sheet_name or not email_share:
+                        st.error("Preencha todos os campos.")
+                    else:
+                        try:
+                            with st.spinner("Verificando a planilha..."):
+                                result = pull_sheet(creds_file, sheet_name, email_share, file_path)
+                            if result["mode"] == "unchanged":
+                                st.toast("A planilha não mudou desde a última sincronização.", icon="☁️")
+                            elif not (result["updated"] or result["appended"] or result["deleted"]):
+                                st.toast("Nenhuma diferença em relação aos dados locais.", icon="☁️")
+                            else:
+                                st.toast(
+                                    f"Planilha importada: {result['updated']} linha(s) alterada(s), "
+                                    f"{result['appended']} adicionada(s) e {result['deleted']} removida(s).",
+                                    icon="✅"
+                                )
+                                time.sleep(1)
+                                st.rerun()
+                        except Exception as e:
+                            st.error(f"Erro na integração: {e}")
 
-            saved_settings = load_settings()
-            default_sheet = saved_settings.get("sheet_name", "")
-            default_email = saved_settings.get("email_share", "")
+                if col_push.button("Enviar para Nuvem", use_container_width=True):
+                    if not sheet_name or not email_share:
+                        st.error("Preencha todos os campos.")
+                    else:
+                        save_settings(sheet_name, email_share)
+                        try:
+                            df_upload = st.session_state.get("editor_export_df", df)
+                            if engine_on:
+                                df_upload = fetch_rows(file_path, df_upload.index)
+                            # Sent by the background worker, the page doesn't wait for Google
+                            enqueue_push(df_upload, creds_file, sheet_name, email_share, force_full=force_full, split=split, source=file_path)
+                            st.toast("Envio agendado! Acompanhe o andamento abaixo.", icon="☁️")
+                        except Exception as e:
+                            st.error(f"Erro na integração: {e}")
+
+                sync_status_panel()
+
+# --- Sync Status (polls the queue while jobs are active) ---
+def describe_result(result):
+    if len(result.get("sheets", [])) > 1:
+        return f"{result['rows']} linhas distribuídas em {len(result['sheets'])} planilhas"
+    if result["mode"] == "full":
+        return f"{result['updated']} linhas enviadas"
+    if result["requests"] == 0:
+        return "a planilha já estava atualizada"
+    return (f"{result['updated']} linha(s) alterada(s), {result['appended']} adicionada(s) "
+            f"e {result['deleted']} removida(s)")
+
+ACTIVE_JOB_STATUSES = ("pending", "running", "retrying")
+
+def render_sync_jobs(jobs):
+    if not jobs:
+        return
+    st.caption("Envios recentes")
+    for job in reversed(jobs):
+        label = f"**{job['sheet_name']}** · {job['rows']} linhas"
+        if job.get("coalesced"):
+            label += f" · {job['coalesced']} envio(s) agrupado(s)"
+        if job["status"] == "pending":
+            st.info(f"⏳ {label}: na fila")
+        elif job["status"] == "running":
+            st.progress(job.get("progress") or 0.0, text=f"Enviando {label} (tentativa {job['attempts']})")
+        elif job["status"] == "retrying":
+            wait = max(0, int(job["next_attempt_at"] - time.time()))
+            st.warning(f"🔁 {label}: nova tentativa em {wait}s ({job['attempts']}/{SYNC_MAX_ATTEMPTS}) · {job['error']}")
+        elif job["status"] == "done":
+            finished = pd.to_datetime(job["updated_at"], unit="s").strftime("%d/%m %H:%M")
+            st.success(f"✅ {label}: {describe_result(job['result'])} ({finished})")
+        else:
+            st.error(f"❌ {label}: falhou · {job['error']}")
+
+@st.fragment(run_every=2)
+def live_sync_status():
+    jobs = load_queue()
+    render_sync_jobs(jobs[-3:])
+    if not any(j["status"] in ACTIVE_JOB_STATUSES for j in jobs):
+        st.rerun()  # Queue drained: redraw the page without the polling fragment
+
+def sync_status_panel():
+    # Only poll while something is queued or sending; an idle queue is drawn once
+    jobs = load_queue()
+    if any(j["status"] in ACTIVE_JOB_STATUSES for j in jobs):
+        live_sync_status()
+    else:
+        render_sync_jobs(jobs[-3:])
 
-            sheet_name = st.text_input("Nome da Planilha (Google Sheets)", value=default_sheet)
-            email_share = st.text_input("Seu E-mail Google", value=default_email)
-            
-            if st.button("Enviar para Nuvem", use_container_width=True):
-                if not sheet_name or not email_share:
-                    st.error("Preencha todos os campos.")
-                else:
-                    save_settings(sheet_name, email_share)
-                    try:
-                        import gspread
-                        from oauth2client.service_account import ServiceAccountCredentials
-                        
-                        with st.spinner("Sincronizando..."):
-                            scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-                            creds = ServiceAccountCredentials.from_json_keyfile_name(creds_file, scope)
-                            client = gspread.authorize(creds)
-                            
-                            try:
-                                sh = client.open(sheet_name)
-                            except:
-                                sh = client.create(sheet_name)
-                                sh.share(email_share, perm_type='user', role='writer')
-                            
-                            ws = sh.get_worksheet(0)
-                            ws.clear()
-                            
-                            # Prepare data for upload (ensure strings)
-                            df_upload = edited_df.copy().astype(str)
-                            ws.update([df_upload.columns.values.tolist()] + df_upload.values.tolist())
-                            
-                            st.success(f"Sucesso! Acesse sua planilha no Drive: {email_share}")
-                            st.balloons()
-                    except Exception as e:
-                        st.error(f"Erro na integração: {e}")
+# Resume pushes left in the queue (e.g. by a restart)
+start_sync_worker()
 
+export_section()
 
+record_timing("Página completa", page_start)
+if st.query_params.get("debug") == "1":
+    show_rerun_timings()
@@ -1,6 +1,8 @@
 import streamlit as st
+import os
 import time
-from utils import load_options, save_options_file
+from utils import load_options, save_options_file, load_data, memory_report, load_history, entry_size, get_cache_limits, update_settings, apply_cache_limits
+from engine import ENGINES, HAS_DUCKDB, active_engine
 import styles
 
 st.set_page_config(page_title="Configurações", layout="wide")
@@ -85,3 +87,62 @@ manage_list(
     "Status", 
     "Etapas do fluxo de trabalho (ex: Pendente, Resolvido)."
 )
+
+# --- Query Engine ---
+st.subheader("Motor de Consultas")
+st.markdown("*Como filtros, busca e agregações são calculados. Com o DuckDB, as consultas rodam direto na cópia de trabalho e só a página exibida é carregada.*")
+
+engine_keys = list(ENGINES)
+new_engine = st.radio(
+    "Motor",
+    engine_keys,
+    index=engine_keys.index(active_engine()),
+    format_func=ENGINES.get,
+    horizontal=True,
+    label_visibility="collapsed"
+)
+if not HAS_DUCKDB:
+    st.caption("DuckDB não está instalado (`pip install duckdb`); o Pandas continua sendo usado.")
+
+if st.button("Salvar Motor", key="btn_engine"):
+    update_settings(engine=new_engine)
+    st.success("Motor de consultas atualizado!")
+    time.sleep(1)
+    st.rerun()
+
+st.markdown("---")
+
+# --- Local Storage ---
+st.subheader("Armazenamento Local")
+st.markdown("*Limites do cache de arquivos enviados. Os arquivos menos usados (e não fixados) são removidos primeiro.*")
+
+history = load_history()
+max_bytes, max_entries = get_cache_limits()
+used_mb = sum(entry_size(item) for item in history) / (1024 * 1024)
+
+col1, col2, col3 = st.columns(3, gap="large")
+with col1:
+    new_max_mb = st.number_input("Espaço máximo (MB)", min_value=10, value=max_bytes // (1024 * 1024), step=50)
+with col2:
+    new_max_entries = st.number_input("Máximo de arquivos", min_value=1, value=max_entries, step=1)
+with col3:
+    st.metric("Em uso", f"{used_mb:.1f} MB", f"{len(history)} arquivo(s)", delta_color="off")
+
+if st.button("Salvar Limites", key="btn_cache_limits"):
+    update_settings(cache_max_mb=int(new_max_mb), cache_max_entries=int(new_max_entries))
+    apply_cache_limits()
+    st.success("Limites atualizados!")
+    time.sleep(1)
+    st.rerun()
+
+current_path = st.session_state.get('current_file_path')
+if current_path and os.path.exists(current_path):
+    with st.expander("Uso de Memória do Arquivo Atual"):
+        if st.button("Gerar Relatório", key="btn_mem_report"):
+            df_current = load_data(current_path)
+            if df_current is not None:
+                report = memory_report(df_current)
+                total_kb = report['Memória (KB)'].sum()
+                raw_kb = report['Sem Esquema (KB)'].sum()
+                st.caption(f"{len(df_current)} linhas · {total_kb / 1024:.2f} MB em memória ({raw_kb / max(total_kb, 0.1):.1f}x menor que sem esquema)")
+                st.dataframe(report, hide_index=True, use_container_width=True)
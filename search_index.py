@@ -0,0 +1,139 @@
+import os
+import threading
+import unicodedata
+import numpy as np
+import pandas as pd
+from utils import load_data, data_version, register_change_listener
+
+# --- Search Index ---
+# Inverted index for the Editor's "Buscar": every distinct cell text (per
+# column, normalized to lowercase without accents) maps to the row ids that
+# hold it, and a trigram index over those texts narrows substring lookups.
+# Built lazily once per dataset version and patched on journal changes.
+_index_cache = {}  # path -> (version, index)
+_index_lock = threading.Lock()
+
+def normalize_text(text):
+    """Lowercase, accent-free form used for both the index and the query."""
+    decomposed = unicodedata.normalize('NFKD', str(text).casefold())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _value_texts(value):
+    # Dates are searchable as shown in the sheet (ISO) and in the grid (DD/MM/YYYY)
+    if isinstance(value, pd.Timestamp):
+        return [value.strftime('%Y-%m-%d'), value.strftime('%d/%m/%Y')]
+    return [str(value)]
+
+def _add_postings(index, text, ids):
+    key = normalize_text(text)
+    postings = index["values"].get(key)
+    if postings is None:
+        index["values"][key] = np.asarray(ids, dtype=np.int64)
+        for tri in _trigrams(key):
+            index["trigrams"].setdefault(tri, set()).add(key)
+    else:
+        index["values"][key] = np.union1d(postings, ids)
+
+def _remove_postings(index, text, ids):
+    key = normalize_text(text)
+    postings = index["values"].get(key)
+    if postings is not None:
+        index["values"][key] = np.setdiff1d(postings, ids, assume_unique=True)
+
+def _index_rows(index, df, add=True):
+    row_ids = df.index.to_numpy(dtype=np.int64)
+    for col in df.columns:
+        codes, uniques = pd.factorize(df[col])
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        for code, value in enumerate(uniques):
+            ids = row_ids[order[bounds[code]:bounds[code + 1]]]
+            for text in _value_texts(value):
+                if add:
+                    _add_postings(index, text, ids)
+                else:
+                    _remove_postings(index, text, ids)
+
+def build_search_index(df):
+    index = {"values": {}, "trigrams": {}}
+    _index_rows(index, df)
+    return index
+
+def get_search_index(file_path):
+    version = data_version(file_path)
+    key = os.path.abspath(file_path)
+    with _index_lock:
+        cached = _index_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    df = load_data(file_path)
+    if df is None:
+        return None
+    index = build_search_index(df)
+    with _index_lock:
+        _index_cache.clear()  # Only the active dataset is worth keeping
+        _index_cache[key] = (version, index)
+    return index
+
+def _on_dataset_change(file_path, old_version, new_version, removed_rows, added_rows):
+    with _index_lock:
+        cached = _index_cache.get(file_path)
+        if cached is None or cached[0] != old_version:
+            return
+        if new_version is None:
+            # Rows were renumbered: the postings hold stale ids
+            del _index_cache[file_path]
+            return
+        index = cached[1]
+        if removed_rows is not None and len(removed_rows):
+            _index_rows(index, removed_rows, add=False)
+        if added_rows is not None and len(added_rows):
+            _index_rows(index, added_rows, add=True)
+        _index_cache[file_path] = (new_version, index)
+
+register_change_listener(_on_dataset_change)
+
+def _lookup(index, query):
+    """Postings of every indexed text containing query."""
+    if len(query) >= 3:
+        # Only texts sharing every trigram of the query can contain it
+        candidates = None
+        for tri in _trigrams(query):
+            texts = index["trigrams"].get(tri, set())
+            candidates = texts if candidates is None else candidates & texts
+            if not candidates:
+                return []
+    else:
+        candidates = index["values"].keys()
+    return [index["values"][text] for text in candidates if query in text]
+
+def search_rows(file_path, term):
+    """
+    Row ids with any cell containing term (case and accent insensitive,
+    so prefixes and partial words match too). None if the index is unavailable.
+    """
+    index = get_search_index(file_path)
+    if index is None:
+        return None
+    query = normalize_text(term.strip())
+    if not query:
+        return None
+
+    # The change listener patches this index in place under _index_lock: read under
+    # it too. Postings arrays are replaced, never mutated, so they can leave the lock.
+    with _index_lock:
+        matches = _lookup(index, query)
+    matches = [ids for ids in matches if len(ids)]
+    if not matches:
+        return np.array([], dtype=np.int64)
+    if len(matches) == 1:
+        return matches[0]
+    # Union of the postings via a bitmap (cheaper than sorting for big results)
+    seen = np.zeros(max(int(ids.max()) for ids in matches) + 1, dtype=bool)
+    for ids in matches:
+        seen[ids] = True
+    return np.flatnonzero(seen)
@@ -0,0 +1,668 @@
+import os
+import json
+import time
+import uuid
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from utils import CACHE_DIR, _atomic_write_json, load_data, append_journal
+
+# --- Google Sheets Sync ---
+# "Enviar para Nuvem" keeps a snapshot of what was last pushed to each sheet
+# (row id + hash per sheet row, in sheet order). The next push only sends the
+# rows whose hash changed (one batched update), appends new rows and deletes
+# removed ones, so its cost follows the size of the change, not of the file.
+# The snapshot also records the sheet's modifiedTime: a diff is only sent
+# while the sheet is still exactly what we last pushed or pulled.
+SHEETS_SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+SYNC_STATE_DIR = os.path.join(CACHE_DIR, "sheets_sync")
+CHUNK_ROWS = 5000
+UPLOAD_WORKERS = 3
+REQUESTS_PER_MINUTE = 55  # Sheets allows 60 write requests/min per user
+SHEET_CELL_LIMIT = 10_000_000  # Per spreadsheet
+
+# --- Client Pool ---
+# One authorized client per credentials file (keyed by its mtime, so a new
+# file gets a new client) shared by every session: its HTTP session and
+# token are reused, and the token is only refreshed when it expires.
+# Spreadsheets opened by name are remembered, so later pushes skip the
+# Drive search by title.
+_client_pool = {}  # (creds path, mtime_ns) -> client
+_spreadsheets = {}  # (creds path, sheet name) -> Spreadsheet handle
+_spreadsheet_ids = {}  # (creds path, sheet name) -> spreadsheet id
+_pool_lock = threading.Lock()
+
+def get_client(creds_file):
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    path = os.path.abspath(creds_file)
+    key = (path, os.stat(path).st_mtime_ns)
+    with _pool_lock:
+        client = _client_pool.get(key)
+        if client is None:
+            creds = ServiceAccountCredentials.from_json_keyfile_name(path, SHEETS_SCOPE)
+            client = gspread.authorize(creds)
+            # Clients of older versions of this file are stale
+            for old_key in [k for k in _client_pool if k[0] == path]:
+                del _client_pool[old_key]
+            _client_pool[key] = client
+    return client
+
+def reset_client_pool():
+    """Drops every pooled client and spreadsheet handle (e.g. after new credentials)."""
+    with _pool_lock:
+        _client_pool.clear()
+        _spreadsheets.clear()
+        _spreadsheet_ids.clear()
+
+def forget_spreadsheet(creds_file, sheet_name):
+    # The handle may be stale (sheet deleted/unshared): reopen by id next time
+    with _pool_lock:
+        _spreadsheets.pop((os.path.abspath(creds_file), sheet_name), None)
+
+def open_spreadsheet(creds_file, sheet_name, email_share, client=None):
+    """Spreadsheet sheet_name, creating and sharing it if needed (client defaults to the pooled one)."""
+    import gspread
+
+    client = client or get_client(creds_file)
+    key = (os.path.abspath(creds_file), sheet_name)
+    with _pool_lock:
+        sh = _spreadsheets.get(key)
+        sheet_id = _spreadsheet_ids.get(key)
+    if sh is not None:
+        return sh
+
+    if sheet_id is not None:
+        try:
+            sh = client.open_by_key(sheet_id)
+        except gspread.SpreadsheetNotFound:
+            sh = None
+    if sh is None:
+        try:
+            sh = client.open(sheet_name)
+        except gspread.SpreadsheetNotFound:
+            sh = client.create(sheet_name)
+            sh.share(email_share, perm_type='user', role='writer')
+    with _pool_lock:
+        _spreadsheets[key] = sh
+        _spreadsheet_ids[key] = sh.id
+    return sh
+
+def open_worksheet(creds_file, sheet_name, email_share, client=None):
+    """First worksheet of sheet_name (see open_spreadsheet)."""
+    return open_spreadsheet(creds_file, sheet_name, email_share, client).get_worksheet(0)
+
+# --- Snapshot ---
+def _state_path(ws):
+    return os.path.join(SYNC_STATE_DIR, f"{ws.spreadsheet.id}_{ws.id}.json")
+
+def load_snapshot(ws):
+    path = _state_path(ws)
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except:
+            return None
+    return None
+
+def save_snapshot(ws, header, ids, hashes, source=None, revision=None):
+    # source: local dataset the ids belong to; revision: sheet modifiedTime after the last push/pull
+    os.makedirs(SYNC_STATE_DIR, exist_ok=True)
+    _atomic_write_json(_state_path(ws), {
+        "header": header,
+        "ids": ids,
+        "hashes": hashes,
+        "source": os.path.abspath(source) if source else None,
+        "revision": revision,
+        "pushed_at": time.time(),
+    })
+
+def forget_snapshot(ws):
+    path = _state_path(ws)
+    if os.path.exists(path):
+        os.remove(path)
+
+# --- Diff ---
+def sheet_header(df):
+    return [str(c) for c in df.columns]
+
+def sheet_rows(df):
+    """Rows of (a slice of) the frame as the sheet receives them: lists of strings."""
+    return df.astype(str).values.tolist()
+
+def row_hashes(df):
+    # One 64-bit hash per row of the string form, computed chunk by chunk
+    hashes = []
+    for start in range(0, len(df), CHUNK_ROWS):
+        part = df.iloc[start:start + CHUNK_ROWS].astype(str)
+        hashes += [format(h, 'x') for h in pd.util.hash_pandas_object(part, index=False).to_numpy()]
+    return hashes
+
+def _a1(row, col):
+    """A1 reference for 1-based row/col."""
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return f"{letters}{row}"
+
+def _blocks(positions):
+    """Contiguous runs of sorted positions as (start, end) pairs, end exclusive."""
+    runs = []
+    for pos in positions:
+        if runs and runs[-1][1] == pos:
+            runs[-1][1] = pos + 1
+        else:
+            runs.append([pos, pos + 1])
+    return [tuple(r) for r in runs]
+
+def plan_push(snapshot, header, ids, hashes):
+    """
+    Compares the last pushed snapshot with the current rows. Returns None when
+    a full resync is needed, else (deleted_positions, changed, appended, new_ids, new_hashes):
+    positions are 0-based data rows, `changed` holds (new position, index in ids)
+    and `appended` indexes in ids, in the order they are added after the kept rows.
+    """
+    if not snapshot or snapshot.get("header") != header:
+        return None
+    current = {row_id: i for i, row_id in enumerate(ids)}
+    if len(current) != len(ids):
+        return None  # Ids must identify sheet rows
+
+    deleted, kept_ids, kept_hashes, changed = [], [], [], []
+    for pos, (row_id, old_hash) in enumerate(zip(snapshot["ids"], snapshot["hashes"])):
+        i = current.pop(row_id, None)
+        if i is None:
+            deleted.append(pos)
+            continue
+        if hashes[i] != old_hash:
+            changed.append((len(kept_ids), i))
+        kept_ids.append(row_id)
+        kept_hashes.append(hashes[i])
+
+    appended = sorted(current.values())  # New rows go after the kept ones, in frame order
+    new_ids = kept_ids + [ids[i] for i in appended]
+    new_hashes = kept_hashes + [hashes[i] for i in appended]
+    return deleted, changed, appended, new_ids, new_hashes
+
+# --- Push ---
+# Rows are converted and sent in bounded chunks, never as one giant list.
+# Full pushes resize the sheet first and write the chunks through a small
+# pool; every request goes through a process-wide pacer that keeps us under
+# the per-minute write quota. Acknowledged chunks are reported so a retried
+# job resumes where it stopped.
+_pace_lock = threading.Lock()
+_next_request_at = 0.0
+
+def _pace():
+    """Blocks until the next request slot of the shared quota."""
+    global _next_request_at
+    with _pace_lock:
+        now = time.monotonic()
+        slot = max(now, _next_request_at)
+        _next_request_at = slot + 60 / REQUESTS_PER_MINUTE
+    time.sleep(max(0.0, slot - now))
+
+def _push_full(ws, df, header, progress, done_chunks, on_chunk):
+    chunks = [(i, start) for i, start in enumerate(range(0, len(df), CHUNK_ROWS)) if i not in done_chunks]
+    total = -(-len(df) // CHUNK_ROWS) or 1
+    acked = [total - len(chunks)]
+
+    _pace()
+    ws.resize(rows=len(df) + 1, cols=max(len(header), 1))
+    _pace()
+    ws.update(values=[header], range_name="A1")
+
+    def send(chunk):
+        i, start = chunk
+        values = sheet_rows(df.iloc[start:start + CHUNK_ROWS])
+        _pace()
+        ws.update(values=values, range_name=_a1(start + 2, 1))
+        return i
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+        futures = [pool.submit(send, chunk) for chunk in chunks]
+        errors = []
+        for future in as_completed(futures):
+            try:
+                i = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            on_chunk(i)
+            acked[0] += 1
+            progress(acked[0] / total)
+    if errors:
+        raise errors[0]
+    return 2 + len(chunks)
+
+def push_dataframe(ws, df, force_full=False, progress=None, done_chunks=None, on_chunk=None, source=None):
+    """
+    Pushes df to the worksheet, incrementally when a matching snapshot exists.
+    Row identity is the frame index (ids of the local dataset `source`, if
+    given, which enables pulling back). progress(fraction) follows the requests;
+    on_chunk(i) acknowledges chunk i of a full push, and chunks listed in
+    done_chunks are skipped (resume). Returns a summary dict of what was sent.
+    """
+    progress = progress or (lambda fraction: None)
+    on_chunk = on_chunk or (lambda i: None)
+    header = sheet_header(df)
+    ids = df.index.tolist()
+    hashes = row_hashes(df)
+    if (len(df) + 1) * max(len(header), 1) > SHEET_CELL_LIMIT:
+        raise ValueError(
+            f"{len(df)} linhas x {len(header)} colunas passam do limite de células do Google Sheets. "
+            "Ative a divisão por mês."
+        )
+
+    snapshot = None if force_full else load_snapshot(ws)
+    plan = plan_push(snapshot, header, ids, hashes)
+    revision = ws.spreadsheet.get_lastUpdateTime() if plan is not None else None
+    if plan is not None and revision != snapshot.get("revision"):
+        # Someone edited the sheet since our last push/pull: the snapshot positions
+        # no longer point at the right rows, so a diff would delete/overwrite others
+        if source:
+            raise ValueError(
+                "A planilha foi alterada por outra pessoa desde o último envio. "
+                "Use \"Puxar da Nuvem\" antes de enviar, ou marque \"Reenviar tudo\" para sobrescrevê-la."
+            )
+        plan = None  # Nothing to pull into (e.g. monthly parts): rewrite the sheet
+    # The sheet no longer matches the snapshot once we start writing: if this
+    # push fails halfway, the retry must be a full (resumable) one
+    forget_snapshot(ws)
+
+    if plan is None:
+        requests = _push_full(ws, df, header, progress, set(done_chunks or ()), on_chunk)
+        save_snapshot(ws, header, ids, hashes, source=source, revision=ws.spreadsheet.get_lastUpdateTime())
+        return {"mode": "full", "updated": len(df), "appended": 0, "deleted": 0, "requests": requests}
+
+    deleted, changed, appended, new_ids, new_hashes = plan
+    requests = 0
+    planned = bool(deleted) + -(-len(changed) // CHUNK_ROWS) + -(-len(appended) // CHUNK_ROWS)
+
+    if deleted:
+        # Bottom-up so earlier deletions don't shift the later ranges (+1 for the header row)
+        delete_requests = [
+            {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": start + 1, "endIndex": end + 1}}}
+            for start, end in reversed(_blocks(deleted))
+        ]
+        _pace()
+        ws.spreadsheet.batch_update({"requests": delete_requests})
+        requests += 1
+        progress(requests / planned)
+
+    # Changed rows grouped into contiguous ranges, up to CHUNK_ROWS rows per batch
+    by_position = dict(changed)
+    positions = sorted(by_position)
+    for offset in range(0, len(positions), CHUNK_ROWS):
+        batch = positions[offset:offset + CHUNK_ROWS]
+        values = sheet_rows(df.iloc[[by_position[pos] for pos in batch]])
+        row_of = dict(zip(batch, values))
+        data = [
+            {"range": f"{_a1(start + 2, 1)}:{_a1(end + 1, len(header))}", "values": [row_of[pos] for pos in range(start, end)]}
+            for start, end in _blocks(batch)
+        ]
+        _pace()
+        ws.batch_update(data)
+        requests += 1
+        progress(requests / planned)
+
+    # Appends stay sequential to keep their order
+    for offset in range(0, len(appended), CHUNK_ROWS):
+        _pace()
+        ws.append_rows(sheet_rows(df.iloc[appended[offset:offset + CHUNK_ROWS]]), table_range="A1")
+        requests += 1
+        progress(requests / planned)
+
+    if requests:
+        revision = ws.spreadsheet.get_lastUpdateTime()
+    save_snapshot(ws, header, new_ids, new_hashes, source=source, revision=revision)
+    return {"mode": "diff", "updated": len(changed), "appended": len(appended), "deleted": len(deleted), "requests": requests}
+
+def split_by_month(df, sheet_name):
+    """(spreadsheet name, rows) per month of Dia; rows without a date go to the base name."""
+    days = pd.to_datetime(df['Dia'], errors='coerce')
+    months = days.dt.strftime('%Y-%m').fillna('')
+    parts = []
+    for month in sorted(months.unique()):
+        name = f"{sheet_name} {month}" if month else sheet_name
+        parts.append((name, df[months == month]))
+    return parts
+
+# --- Sync Queue ---
+# Pushes run on a background worker thread from a persistent queue file, so
+# the Editor returns right after "Enviar para Nuvem" and a pending push
+# survives reruns and restarts. The rows to send are frozen in a Parquet
+# snapshot at click time; a newer push of the same sheet replaces any queued
+# one that has not run yet. Quota (429) and server (5xx) errors are retried with
+# exponential backoff.
+SYNC_QUEUE_FILE = os.path.join(CACHE_DIR, "sheets_queue.json")
+SYNC_MAX_ATTEMPTS = 6
+SYNC_BACKOFF_BASE = 2  # Seconds, doubled on every attempt
+SYNC_BACKOFF_MAX = 300
+SYNC_HISTORY_KEEP = 10  # Finished jobs kept for the status panel
+RETRY_STATUS = {408, 429}
+
+_queue_lock = threading.RLock()
+_worker = None
+
+def load_queue():
+    if os.path.exists(SYNC_QUEUE_FILE):
+        try:
+            with open(SYNC_QUEUE_FILE, "r") as f:
+                return json.load(f)
+        except:
+            return []
+    return []
+
+def _save_queue(jobs):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _atomic_write_json(SYNC_QUEUE_FILE, jobs)
+
+def _update_job(job_id, **changes):
+    with _queue_lock:
+        jobs = load_queue()
+        for job in jobs:
+            if job["id"] == job_id:
+                job.update(changes, updated_at=time.time())
+        _save_queue(jobs)
+
+def enqueue_push(df, creds_file, sheet_name, email_share, force_full=False, split=False, source=None):
+    """Queues a push of df to sheet_name and makes sure the worker is running."""
+    os.makedirs(SYNC_STATE_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex[:12]
+    data_path = os.path.join(SYNC_STATE_DIR, f"job_{job_id}.parquet")
+    # Frozen as the strings the sheet gets, later edits don't change this push
+    df.astype(str).to_parquet(data_path, index=True)
+
+    with _queue_lock:
+        jobs = load_queue()
+        jobs.append({
+            "id": job_id, "sheet_name": sheet_name, "email_share": email_share,
+            "creds_file": creds_file, "data_path": data_path, "rows": len(df),
+            "force_full": force_full, "split": split, "chunks_done": [],
+            "source": os.path.abspath(source) if source else None,
+            "status": "pending", "attempts": 0,
+            "next_attempt_at": 0, "error": None, "result": None,
+            "created_at": time.time(), "updated_at": time.time(),
+        })
+        _save_queue(_coalesce(jobs))
+    start_sync_worker()
+
+def _coalesce(jobs):
+    """
+    Keeps only the newest waiting push of each sheet: older ones would be
+    overwritten by it anyway. A forced full resync carries over.
+    """
+    newest = {}
+    for job in jobs:
+        if job["status"] in ("pending", "retrying"):
+            newest[job["sheet_name"]] = job
+    kept = []
+    for job in jobs:
+        latest = newest.get(job["sheet_name"])
+        if job["status"] in ("pending", "retrying") and job is not latest:
+            latest["force_full"] = latest["force_full"] or job["force_full"]
+            latest["coalesced"] = latest.get("coalesced", 0) + job.get("coalesced", 0) + 1
+            if os.path.exists(job["data_path"]):
+                os.remove(job["data_path"])
+            continue
+        kept.append(job)
+    return kept
+
+def _is_retryable(error):
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUS or status >= 500
+    # Timeouts and dropped connections (requests' errors are OSErrors too)
+    return isinstance(error, (TimeoutError, ConnectionError)) or (
+        isinstance(error, OSError) and not isinstance(error, FileNotFoundError)
+    )
+
+def _backoff(attempts):
+    return min(SYNC_BACKOFF_MAX, SYNC_BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+def _next_job():
+    """Marks and returns the first job due to run, or (None, seconds until the next one)."""
+    with _queue_lock:
+        queued = load_queue()
+        jobs = _coalesce(queued)  # A failed push may now be superseded by a newer one
+        if len(jobs) != len(queued):
+            _save_queue(jobs)
+        now = time.time()
+        active = [j for j in jobs if j["status"] in ("pending", "retrying")]
+        if not active:
+            return None, None
+        due = [j for j in active if j["next_attempt_at"] <= now]
+        if not due:
+            return None, min(j["next_attempt_at"] for j in active) - now
+        job = due[0]
+        job.update(status="running", attempts=job["attempts"] + 1, progress=0.0, updated_at=now)
+        _save_queue(jobs)
+        return dict(job), 0
+
+def _prune_finished(jobs):
+    finished = [j for j in jobs if j["status"] in ("done", "failed")]
+    for job in finished[:-SYNC_HISTORY_KEEP]:
+        jobs.remove(job)
+    return jobs
+
+def _run_job(job):
+    parts = [(job["sheet_name"], None)]
+    try:
+        df = pd.read_parquet(job["data_path"])
+        if job.get("split") and (len(df) + 1) * max(len(df.columns), 1) > SHEET_CELL_LIMIT:
+            parts = split_by_month(df, job["sheet_name"])
+        else:
+            parts = [(job["sheet_name"], df)]
+
+        chunks_done = set(job.get("chunks_done") or [])
+        results = []
+        for n, (name, part) in enumerate(parts):
+            def progress(fraction, n=n):
+                _update_job(job["id"], progress=round((n + fraction) / len(parts), 2))
+            def on_chunk(i, name=name):
+                # Acknowledged chunks survive a failure: the retry skips them
+                chunks_done.add(f"{name}:{i}")
+                _update_job(job["id"], chunks_done=sorted(chunks_done))
+            done = {int(k.rsplit(":", 1)[1]) for k in chunks_done if k.rsplit(":", 1)[0] == name}
+            ws = open_worksheet(job["creds_file"], name, job["email_share"])
+            results.append(push_dataframe(
+                ws, part, force_full=job["force_full"] or bool(done),
+                progress=progress, done_chunks=done, on_chunk=on_chunk,
+                source=job.get("source") if len(parts) == 1 else None,
+            ))
+            # A finished part has its snapshot: a retry only diffs it
+            chunks_done = {k for k in chunks_done if k.rsplit(":", 1)[0] != name}
+            _update_job(job["id"], chunks_done=sorted(chunks_done))
+        result = {
+            "mode": "full" if any(r["mode"] == "full" for r in results) else "diff",
+            "updated": sum(r["updated"] for r in results),
+            "appended": sum(r["appended"] for r in results),
+            "deleted": sum(r["deleted"] for r in results),
+            "requests": sum(r["requests"] for r in results),
+            "rows": len(df),
+            "sheets": [name for name, _ in parts],
+        }
+    except Exception as e:
+        for name, _ in parts:
+            forget_spreadsheet(job["creds_file"], name)
+        retry = _is_retryable(e) and job["attempts"] < SYNC_MAX_ATTEMPTS
+        _update_job(
+            job["id"],
+            status="retrying" if retry else "failed",
+            next_attempt_at=time.time() + _backoff(job["attempts"]) if retry else 0,
+            error=str(e) or type(e).__name__,
+        )
+        return
+
+    with _queue_lock:
+        jobs = load_queue()
+        for j in jobs:
+            if j["id"] == job["id"]:
+                j.update(status="done", result=result, error=None, progress=1.0, updated_at=time.time())
+        _save_queue(_prune_finished(jobs))
+    # The snapshot file is only removed once the job is done (or replaced)
+    if os.path.exists(job["data_path"]):
+        os.remove(job["data_path"])
+
+def _worker_loop():
+    global _worker
+    while True:
+        job, wait = _next_job()
+        if job is not None:
+            _run_job(job)
+            continue
+        with _queue_lock:
+            # Re-checked under the lock so a job queued right now is not missed
+            if not any(j["status"] in ("pending", "retrying") for j in load_queue()):
+                _worker = None
+                return
+        time.sleep(min(max(wait or 0, 0.1), 1.0))
+
+def start_sync_worker():
+    """Starts the worker thread if there is queued work and none is running."""
+    global _worker
+    with _queue_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        jobs = load_queue()
+        # A job left "running" belonged to a worker that died (restart): run it again
+        for job in jobs:
+            if job["status"] == "running":
+                job["status"] = "pending"
+        if not any(j["status"] in ("pending", "retrying") for j in jobs):
+            return
+        _save_queue(jobs)
+        _worker = threading.Thread(target=_worker_loop, daemon=True)
+        _worker.start()
+
+# --- Pull ---
+# "Puxar da Nuvem" brings collaborators' edits back into the local dataset.
+# The sheet's Drive modifiedTime is checked first, so an unchanged sheet is
+# never downloaded. Otherwise its rows are hashed and matched against the
+# snapshot of the last push/pull: only rows whose hash changed become
+# journal ops, which moves data_version and refreshes every derived cache.
+EMPTY_CELLS = {"", "nan", "NaT", "<NA>", "None"}
+
+def _cell_value(col, text):
+    """Journal value for a sheet cell (sheets hold strings only)."""
+    if text.strip() in EMPTY_CELLS:
+        return None
+    if col == 'Dia':
+        day = pd.to_datetime(text, dayfirst='/' in text, errors='coerce')
+        return None if pd.isna(day) else day
+    return text
+
+def match_rows(snapshot_ids, snapshot_hashes, hashes):
+    """
+    Row id for each sheet row (None for new rows) and the snapshot ids no longer
+    in the sheet. Unchanged rows are matched by hash wherever they moved to.
+    The rest are edited rows when they sit between the same unchanged
+    neighbours in the snapshot and in the sheet, else inserts/deletions.
+    """
+    pool = {}
+    for row_id, h in zip(snapshot_ids, snapshot_hashes):
+        pool.setdefault(h, []).append(row_id)
+    matched = [pool[h].pop(0) if pool.get(h) else None for h in hashes]
+    leftover = {row_id for ids in pool.values() for row_id in ids}
+
+    # Unmatched rows grouped by the last unchanged row before them
+    old_gaps, new_gaps, anchor = {}, {}, None
+    for row_id in snapshot_ids:
+        if row_id in leftover:
+            old_gaps.setdefault(anchor, []).append(row_id)
+        else:
+            anchor = row_id
+    anchor = None
+    for i, row_id in enumerate(matched):
+        if row_id is None:
+            new_gaps.setdefault(anchor, []).append(i)
+        else:
+            anchor = row_id
+
+    removed = []
+    for anchor, old_ids in old_gaps.items():
+        positions = new_gaps.get(anchor, [])
+        for i, row_id in zip(positions, old_ids):
+            matched[i] = row_id
+        removed += old_ids[len(positions):]
+    return matched, removed
+
+def pull_worksheet(ws, file_path):
+    """
+    Merges the worksheet's changes into the local dataset file_path. Returns
+    a summary dict; mode is "unchanged" when the sheet revision didn't move.
+    """
+    snapshot = load_snapshot(ws)
+    source = os.path.abspath(file_path)
+    if not snapshot or snapshot.get("source") != source:
+        raise ValueError("Envie os dados atuais para esta planilha antes de puxar as alterações dela.")
+    revision = ws.spreadsheet.get_lastUpdateTime()
+    if revision == snapshot.get("revision"):
+        return {"mode": "unchanged", "updated": 0, "appended": 0, "deleted": 0}
+
+    values = ws.get_all_values()
+    header, rows = (values[0], values[1:]) if values else (snapshot["header"], [])
+    if header != snapshot["header"]:
+        raise ValueError("As colunas da planilha não conferem com as do último envio.")
+    width = len(header)
+    sheet_df = pd.DataFrame([(row + [""] * width)[:width] for row in rows], columns=header)
+    hashes = row_hashes(sheet_df)
+    ids, removed = match_rows(snapshot["ids"], snapshot["hashes"], hashes)
+
+    df = load_data(file_path)
+    local = df.index
+    ops, updated = [], 0
+    old_hashes = dict(zip(snapshot["ids"], snapshot["hashes"]))
+    changed = [
+        i for i, row_id in enumerate(ids)
+        if row_id is not None and row_id in local and old_hashes[row_id] != hashes[i]
+    ]
+    if changed:
+        current = df.loc[[ids[i] for i in changed], [c for c in header if c in df.columns]].astype(str)
+        for i, (_, local_row) in zip(changed, current.iterrows()):
+            diff = {
+                col: _cell_value(col, sheet_df.iat[i, k])
+                for k, col in enumerate(header)
+                if col in local_row.index and sheet_df.iat[i, k] != local_row[col]
+            }
+            if diff:
+                ops.append({"op": "update", "ids": [ids[i]], "values": diff})
+                updated += 1
+
+    # New sheet rows, and rows edited in the sheet that were deleted locally, come
+    # in as inserts. Untouched sheet rows deleted locally stay deleted (the next
+    # push removes them from the sheet).
+    new_positions = [
+        i for i, row_id in enumerate(ids)
+        if row_id is None or (row_id not in local and old_hashes[row_id] != hashes[i])
+    ]
+    insert = None
+    if new_positions:
+        insert = {
+            "op": "insert",
+            "rows": [{col: _cell_value(col, sheet_df.iat[i, k]) for k, col in enumerate(header)} for i in new_positions],
+        }
+        ops.append(insert)
+    deleted = [row_id for row_id in removed if row_id in local]
+    if deleted:
+        ops.append({"op": "delete", "ids": deleted})
+
+    if ops:
+        append_journal(file_path, ops)  # Assigns the ids of the inserted rows
+    if insert is not None:
+        for i, row_id in zip(new_positions, insert["ids"]):
+            ids[i] = row_id
+    save_snapshot(ws, header, ids, hashes, source=source, revision=revision)
+    return {"mode": "merged", "updated": updated, "appended": len(new_positions), "deleted": len(deleted)}
+
+def pull_sheet(creds_file, sheet_name, email_share, file_path):
+    """pull_worksheet for sheet_name, refused while a push to it is queued."""
+    if any(j["sheet_name"] == sheet_name and j["status"] in ("pending", "running", "retrying") for j in load_queue()):
+        raise ValueError("Há um envio pendente para esta planilha. Aguarde a conclusão antes de puxar.")
+    return pull_worksheet(open_worksheet(creds_file, sheet_name, email_share), file_path)
@@ -1,8 +1,21 @@
 import os
+import io
 import json
+import hashlib
 import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 import pandas as pd
 import streamlit as st
+from openpyxl import Workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
 
 CACHE_DIR = "cache_data"
 HISTORY_FILE = "upload_history.json"
@@ -13,6 +26,19 @@ if not os.path.exists(CACHE_DIR):
     os.makedirs(CACHE_DIR)
 
 # --- History Management ---
+# Defaults for the cache_data/ retention (overridable in Configurações)
+CACHE_MAX_BYTES = 500 * 1024 * 1024
+CACHE_MAX_ENTRIES = 20
+
+_history_lock = threading.RLock()
+
+def _atomic_write_json(path, data):
+    # Write to a temp file and swap it in, readers never see a half-written file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
 def load_history():
     if os.path.exists(HISTORY_FILE):
         try:
@@ -23,82 +49,767 @@ def load_history():
     return []
 
 def save_history(history):
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f)
+    with _history_lock:
+        _atomic_write_json(HISTORY_FILE, history)
+
+def update_history(change):
+    """Applies change(history) under the history lock and saves the result."""
+    with _history_lock:
+        history = load_history()
+        result = change(history)
+        save_history(history)
+        return result
+
+def entry_artifacts(item):
+    """
+    Every file belonging to a history entry: the raw upload plus anything
+    derived from it (working copy, journal, ...), which are all named with
+    the upload path as prefix.
+    """
+    source_path = item.get('source_path', item['path'])
+    paths = {item['path'], journal_path(item['path']), source_path}
+    if os.path.isdir(CACHE_DIR) and os.path.dirname(os.path.abspath(source_path)) == os.path.abspath(CACHE_DIR):
+        prefix = os.path.basename(source_path)
+        paths.update(os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if name.startswith(prefix))
+    return [p for p in paths if os.path.exists(p)]
+
+def entry_size(item):
+    return sum(os.path.getsize(p) for p in entry_artifacts(item))
+
+def _remove_entry_files(item):
+    invalidate_data_cache(item['path'])
+    for old_path in entry_artifacts(item):
+        try:
+            os.remove(old_path)
+        except:
+            pass
+
+def _last_used(item):
+    return item.get('last_opened', item.get('timestamp', 0))
+
+def get_cache_limits():
+    settings = load_settings()
+    max_bytes = int(settings.get("cache_max_mb", CACHE_MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+    max_entries = int(settings.get("cache_max_entries", CACHE_MAX_ENTRIES))
+    return max_bytes, max_entries
+
+def enforce_cache_limits(history):
+    """
+    Evicts least recently opened, unpinned entries (with all their files)
+    until the history fits the entry limit and byte budget. The most recent
+    entry is never evicted. Mutates and returns history.
+    """
+    max_bytes, max_entries = get_cache_limits()
+    sizes = {item['path']: entry_size(item) for item in history}
+    total = sum(sizes.values())
+    newest = max(history, key=_last_used)['path'] if history else None
+
+    candidates = sorted(
+        (item for item in history if not item.get('pinned') and item['path'] != newest),
+        key=_last_used
+    )
+    for item in candidates:
+        if len(history) <= max_entries and total <= max_bytes:
+            break
+        history.remove(item)
+        total -= sizes[item['path']]
+        _remove_entry_files(item)
+    return history
+
+def touch_history(file_path):
+    """Marks an entry as used now (LRU order), e.g. when it is opened from Home."""
+    def change(history):
+        for item in history:
+            if item['path'] == file_path:
+                item['last_opened'] = time.time()
+    update_history(change)
+
+def set_pinned(file_path, pinned):
+    """Pinned entries are never evicted by the cache limits."""
+    def change(history):
+        for item in history:
+            if item['path'] == file_path:
+                item['pinned'] = bool(pinned)
+        enforce_cache_limits(history)
+    update_history(change)
+
+def apply_cache_limits():
+    update_history(enforce_cache_limits)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_upload(uploaded_file):
+    """SHA-256 of the upload, fed in chunks straight from its buffer (no copy)."""
+    digest = hashlib.sha256()
+    buffer = uploaded_file.getbuffer()
+    for start in range(0, len(buffer), HASH_CHUNK_SIZE):
+        digest.update(buffer[start:start + HASH_CHUNK_SIZE])
+    return digest.hexdigest()
+
+def _unedited(item):
+    """True while the entry's working copy is exactly what was ingested (no journal, no compaction)."""
+    path = item['path']
+    return (
+        os.path.exists(path) and not os.path.exists(journal_path(path))
+        and item.get('data_version') == list(data_version(path))
+    )
 
 def save_uploaded_file(uploaded_file):
-    # Saves file physically
-    ext = os.path.splitext(uploaded_file.name)[1]
-    if not ext:
-        ext = ".csv" if uploaded_file.type == 'text/csv' else ".xlsx"
-    
+    # Same bytes -> same entry: files are stored and parsed once per content hash,
+    # as long as that working copy hasn't been edited since (re-uploading discards edits)
+    content_hash = hash_upload(uploaded_file)
+    with _history_lock:
+        history = load_history()
+        for i, item in enumerate(history):
+            if item.get('hash') == content_hash and _unedited(item):
+                item['original_name'] = uploaded_file.name
+                item['last_opened'] = time.time()
+                history.insert(0, history.pop(i))
+                save_history(history)
+                return item['path']
+
     # Unique name
-    filename = f"{int(time.time())}_{uploaded_file.name}"
+    filename = f"{content_hash[:16]}_{uploaded_file.name}"
+    if os.path.exists(os.path.join(CACHE_DIR, filename)):
+        # An edited copy of the same bytes is still around: don't overwrite it
+        filename = f"{content_hash[:16]}-{time.time_ns()}_{uploaded_file.name}"
     file_path = os.path.join(CACHE_DIR, filename)
 
     try:
         with open(file_path, "wb") as f:
             f.write(uploaded_file.getbuffer())
-        
-        # Update history
-        history = load_history()
-        # Remove duplicates by name (keeping newest)
-        history = [h for h in history if h['original_name'] != uploaded_file.name]
-        
-        # Add to top
-        history.insert(0, {
-            "path": file_path,
-            "original_name": uploaded_file.name,
-            "timestamp": time.time()
-        })
-        
-        # Keep only last 3
-        if len(history) > 3:
-            removed = history.pop()
-            if os.path.exists(removed['path']):
-                try:
-                    os.remove(removed['path'])
-                except:
-                    pass
-        
-        save_history(history)
+
+        # Convert once into the columnar working copy every page reads from
+        source_path = file_path
+        file_path = create_working_copy(source_path)
+
+        def change(history):
+            # Remove duplicates by name (keeping newest, unless pinned)
+            for item in [h for h in history if h['original_name'] == uploaded_file.name and not h.get('pinned')]:
+                history.remove(item)
+                _remove_entry_files(item)
+
+            # Add to top
+            now = time.time()
+            history.insert(0, {
+                "path": file_path,
+                "source_path": source_path,
+                "original_name": uploaded_file.name,
+                "hash": content_hash,
+                "data_version": list(data_version(file_path)),
+                "timestamp": now,
+                "last_opened": now,
+                "pinned": False
+            })
+            enforce_cache_limits(history)
+
+        update_history(change)
         return file_path
     except Exception as e:
         st.error(f"Erro ao salvar cache: {e}")
         return None
 
 # --- Data Loading ---
-def load_data(file_input):
-    try:
-        if isinstance(file_input, str):
-            if file_input.endswith('.csv'):
-                df = pd.read_csv(file_input)
-            else:
-                df = pd.read_excel(file_input)
+# Parsed DataFrames are kept in a process-wide LRU cache keyed by the file's
+# path + size + mtime, so Streamlit reruns don't re-parse the spreadsheet.
+DATA_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_data_cache = OrderedDict()  # (path, columns) -> (version, df, nbytes)
+_data_cache_bytes = 0
+_data_cache_lock = threading.Lock()
+
+# Editor changes are appended to a per-file journal instead of rewriting the
+# whole file; the journal is replayed on load and folded back in by compaction.
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+_compacting = set()
+
+def journal_path(file_path):
+    return f"{file_path}{JOURNAL_SUFFIX}"
+
+def _path_lock(file_path):
+    path = os.path.abspath(file_path)
+    with _path_locks_lock:
+        if path not in _path_locks:
+            _path_locks[path] = threading.RLock()
+        return _path_locks[path]
+
+def data_version(file_path):
+    """Returns a tuple that changes whenever the file or its journal is written."""
+    stat = os.stat(file_path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    jpath = journal_path(file_path)
+    if os.path.exists(jpath):
+        jstat = os.stat(jpath)
+        version += (jstat.st_size, jstat.st_mtime_ns)
+    return version
+
+def _cache_get(key, version):
+    with _data_cache_lock:
+        entry = _data_cache.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        _data_cache.move_to_end(key)
+        return entry[1]
+
+def _cache_put(key, version, df):
+    global _data_cache_bytes
+    nbytes = int(df.memory_usage(index=True, deep=True).sum())
+    with _data_cache_lock:
+        old = _data_cache.pop(key, None)
+        if old is not None:
+            _data_cache_bytes -= old[2]
+        if nbytes > DATA_CACHE_MAX_BYTES:
+            return
+        _data_cache[key] = (version, df, nbytes)
+        _data_cache_bytes += nbytes
+        # Evict least recently used datasets until we fit the budget
+        while _data_cache_bytes > DATA_CACHE_MAX_BYTES and _data_cache:
+            _, (_, _, freed) = _data_cache.popitem(last=False)
+            _data_cache_bytes -= freed
+
+def invalidate_data_cache(file_path=None):
+    """Drops the cached DataFrame for file_path (or every cached file)."""
+    global _data_cache_bytes
+    with _data_cache_lock:
+        if file_path is None:
+            _data_cache.clear()
+            _data_cache_bytes = 0
+            return
+        path = os.path.abspath(file_path)
+        for key in [k for k in _data_cache if k[0] == path]:
+            _data_cache_bytes -= _data_cache.pop(key)[2]
+
+def _read_file(file_input, columns=None):
+    if isinstance(file_input, str):
+        if file_input.endswith('.parquet'):
+            # Working copies are already normalized, just load the columns
+            if columns is not None:
+                available = pq.read_schema(file_input).names
+                columns = [c for c in columns if c in available]
+            return apply_schema(pd.read_parquet(file_input, columns=columns, memory_map=True))
+        elif file_input.endswith('.csv'):
+            df = pd.read_csv(file_input)
         else:
-            if file_input.name.endswith('.csv'):
-                df = pd.read_csv(file_input)
-            else:
-                df = pd.read_excel(file_input)
-        
-        # Basic Preprocessing
-        # Normalize column names (remove accents)
-        rename_map = {
-            'Responsável': 'Responsavel',
-            'Inconsistências': 'Inconsistencias',
-            'Situação': 'Status',
-            'Estado': 'Status'
-        }
-        df.rename(columns=rename_map, inplace=True)
-
-        if 'Dia' in df.columns:
-            df['Dia'] = pd.to_datetime(df['Dia'], errors='coerce')
-            
-        return df
+            df = pd.read_excel(file_input)
+    else:
+        if file_input.name.endswith('.csv'):
+            df = pd.read_csv(file_input)
+        else:
+            df = pd.read_excel(file_input)
+
+    # Basic Preprocessing
+    # Normalize column names (remove accents)
+    rename_map = {
+        'Responsável': 'Responsavel',
+        'Inconsistências': 'Inconsistencias',
+        'Situação': 'Status',
+        'Estado': 'Status'
+    }
+    df.rename(columns=rename_map, inplace=True)
+
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return apply_schema(df)
+
+# --- Ledger Schema ---
+# Applied once when a dataset is loaded, so pages don't re-convert on every rerun
+CATEGORY_COLUMNS = ['Responsavel', 'Status', 'Inconsistencias']
+
+def _compact_quantity(series):
+    values = pd.to_numeric(series, errors='coerce')
+    valid = values.dropna()
+    # Small nullable integer when the data allows it, otherwise keep floats
+    if valid.empty or ((valid % 1 == 0).all() and valid.abs().max() < 2 ** 31):
+        return values.astype('Int32')
+    return values.astype('float64')
+
+def apply_schema(df):
+    """
+    Converts the ledger columns to compact types: categories for the
+    low-cardinality text fields, Int32 for Quantidade and datetime64 for Dia.
+    Columns already in the right type are left untouched.
+    """
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    if 'Quantidade' in df.columns and str(df['Quantidade'].dtype) not in ('Int32', 'float64'):
+        df['Quantidade'] = _compact_quantity(df['Quantidade'])
+    if 'Dia' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Dia']):
+        df['Dia'] = pd.to_datetime(df['Dia'], errors='coerce')
+    return df
+
+def memory_report(df):
+    """Per-column dtype and resident memory of a loaded dataset."""
+    usage = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'Coluna': usage.index,
+        'Tipo': [str(df[col].dtype) for col in usage.index],
+        'Memória (KB)': (usage.values / 1024).round(1),
+    })
+    # What the column would take with pandas' default types (object text, int64)
+    def default_bytes(col):
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            return df[col].astype(object).memory_usage(index=False, deep=True)
+        if str(df[col].dtype) == 'Int32':
+            return len(df) * 8
+        return usage[col]
+    report['Sem Esquema (KB)'] = [round(default_bytes(col) / 1024, 1) for col in usage.index]
+    return report
+
+def _read_dataset(file_path, columns=None):
+    # Base file + replayed journal
+    df = _read_file(file_path, columns)
+    jpath = journal_path(file_path)
+    if os.path.exists(jpath):
+        with open(jpath, "r", encoding="utf-8") as f:
+            ops = [json.loads(line) for line in f if line.strip()]
+        df = _apply_ops(df, ops)
+    return df
+
+def load_data(file_input, columns=None):
+    """
+    Loads the dataset at file_input. `columns` restricts the load to those
+    columns (only the needed ones are read from Parquet working copies).
+    """
+    try:
+        if not isinstance(file_input, str):
+            return _read_file(file_input, columns)
+
+        with _path_lock(file_input):
+            key = (os.path.abspath(file_input), tuple(columns) if columns is not None else None)
+            version = data_version(file_input)
+            df = _cache_get(key, version)
+            if df is None and columns is not None:
+                # A full load of the same version already holds these columns
+                full_df = _cache_get((key[0], None), version)
+                if full_df is not None:
+                    return full_df[[c for c in columns if c in full_df.columns]].copy()
+            if df is None:
+                df = _read_dataset(file_input, columns)
+                _cache_put(key, version, df)
+            # Pages mutate the frame they get (bulk edit, drop), never hand out the cached one.
+            # Copied under the lock: append_journal updates the cached frame in place.
+            return df.copy()
     except Exception as e:
         st.error(f"Erro ao ler o arquivo: {e}")
         return None
 
+def parquet_column_bounds(file_path, column):
+    """
+    (min, max) of a column from the Parquet footer statistics, without reading
+    any data. Covers the base file only (see journal_column_values for pending
+    edits). None when not available (not Parquet, no statistics).
+    """
+    if not HAS_PARQUET or not file_path.endswith('.parquet'):
+        return None
+    try:
+        meta = pq.ParquetFile(file_path).metadata
+        idx = meta.schema.names.index(column)
+        lows, highs = [], []
+        for rg in range(meta.num_row_groups):
+            stats = meta.row_group(rg).column(idx).statistics
+            if stats is None or not stats.has_min_max:
+                if stats is not None and stats.null_count == meta.row_group(rg).num_rows:
+                    continue  # Only nulls in this row group
+                return None
+            lows.append(stats.min)
+            highs.append(stats.max)
+        if not lows:
+            return None
+        return min(lows), max(highs)
+    except Exception:
+        return None
+
+# --- Edit Journal ---
+# One JSON object per line, row ids are the DataFrame index:
+#   {"op": "update", "ids": [...], "values": {"Status": "Resolvido"}}
+#   {"op": "insert", "ids": [...], "rows": [{...}, ...]}
+#   {"op": "delete", "ids": [...]}
+def _json_default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+def journal_column_values(file_path, column):
+    """Values the pending journal writes into column (inserted rows and updates), as stored."""
+    path = journal_path(file_path)
+    if not os.path.exists(path):
+        return []
+    values = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            op = json.loads(line)
+            if op.get("op") == "insert":
+                values += [row.get(column) for row in op["rows"]]
+            elif op.get("op") == "update" and column in op["values"]:
+                values.append(op["values"][column])
+    return [v for v in values if v is not None]
+
+def _coerce_value(df, col, value):
+    # Keep the column dtype when applying journal values (dates come back as ISO strings)
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if pd.api.types.is_datetime64_any_dtype(df[col]):
+        return pd.to_datetime(value, errors='coerce')
+    if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+        return pd.to_numeric(value, errors='coerce')
+    return value
+
+def _apply_ops(df, ops):
+    for op in ops:
+        kind = op.get("op")
+        if kind == "update":
+            ids = df.index.intersection(op["ids"])
+            for col, value in op["values"].items():
+                if col in df.columns and not ids.empty:
+                    value = _coerce_value(df, col, value)
+                    if isinstance(df[col].dtype, pd.CategoricalDtype) and value is not None and value not in df[col].cat.categories:
+                        df[col] = df[col].cat.add_categories([value])
+                    try:
+                        df.loc[ids, col] = value
+                    except ValueError:
+                        # Parquet loads can hand out read-only (zero-copy) arrays
+                        df[col] = df[col].copy()
+                        df.loc[ids, col] = value
+        elif kind == "insert":
+            new_rows = pd.DataFrame(op["rows"], index=op["ids"])
+            new_rows = new_rows.reindex(columns=df.columns)
+            for col in new_rows.columns:
+                if pd.api.types.is_datetime64_any_dtype(df[col]) or col == 'Dia':
+                    new_rows[col] = pd.to_datetime(new_rows[col], errors='coerce')
+                elif pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+                    new_rows[col] = pd.to_numeric(new_rows[col], errors='coerce')
+                elif isinstance(df[col].dtype, pd.CategoricalDtype):
+                    # Share the categories so concat keeps the column categorical
+                    missing = pd.Index(new_rows[col].dropna().unique()).difference(df[col].cat.categories)
+                    if len(missing):
+                        df[col] = df[col].cat.add_categories(missing)
+                    new_rows[col] = pd.Categorical(new_rows[col], categories=df[col].cat.categories)
+            if len(df) == 0:
+                df = new_rows
+            else:
+                df = pd.concat([df, new_rows])
+        elif kind == "delete":
+            df = df.drop(index=df.index.intersection(op["ids"]))
+    return apply_schema(df)
+
+# Derived data (aggregates, indexes) subscribes to journal changes so it can
+# apply the delta instead of recomputing from scratch.
+_change_listeners = []
+
+def register_change_listener(listener):
+    """
+    listener(file_path, old_version, new_version, removed_rows, added_rows) is
+    called after every journal append (rows as they were before / are after
+    the change) and compaction (both None: same content, new version). When
+    compaction renumbers the rows (csv/xlsx bases don't store the ids),
+    new_version is None too: derived data holding row ids must be dropped.
+    """
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+def _notify_change(file_path, old_version, new_version, removed_rows, added_rows):
+    for listener in _change_listeners:
+        try:
+            listener(os.path.abspath(file_path), old_version, new_version, removed_rows, added_rows)
+        except Exception as e:
+            print(f"Falha ao atualizar dados derivados de {file_path}: {e}")
+
+# Row ids are never reused: a deleted row's id may still be referenced (Sheets
+# snapshots, selections), so new rows continue from the largest id ever given.
+# The counter is kept in the Parquet footer by full writes and recovered from
+# the journal (which records every id it touches) for edits since then.
+ROW_ID_COUNTER_KEY = b"next_row_id"
+_row_id_counters = {}  # path -> next unused row id (under the path lock)
+
+def _stored_row_id_counter(file_path):
+    if not (HAS_PARQUET and file_path.endswith('.parquet')):
+        return 0
+    try:
+        schema = pq.read_schema(file_path)
+    except Exception:
+        return 0
+    stored = (schema.metadata or {}).get(ROW_ID_COUNTER_KEY)
+    if stored is not None:
+        return int(stored)
+    # Working copy from before the counter: its largest id (index column only)
+    ids = pd.read_parquet(file_path, columns=[]).index
+    return int(ids.max()) + 1 if len(ids) else 0
+
+def _journal_row_ids_end(file_path):
+    end = 0
+    jpath = journal_path(file_path)
+    if os.path.exists(jpath):
+        with open(jpath, "r", encoding="utf-8") as f:
+            for line in f:
+                ids = json.loads(line).get("ids") if line.strip() else None
+                if ids:
+                    end = max(end, int(max(ids)) + 1)
+    return end
+
+def next_row_id(file_path, df=None):
+    """First row id never handed out for file_path (df: its rows, when already loaded)."""
+    path = os.path.abspath(file_path)
+    counter = _row_id_counters.get(path)
+    if counter is None:
+        counter = max(_stored_row_id_counter(file_path), _journal_row_ids_end(file_path))
+    if df is not None and len(df):
+        counter = max(counter, int(df.index.max()) + 1)
+    _row_id_counters[path] = counter
+    return counter
+
+def _advance_row_id_counter(file_path, ops):
+    path = os.path.abspath(file_path)
+    used = [int(max(op["ids"])) + 1 for op in ops if op.get("ids")]
+    _row_id_counters[path] = max([_row_id_counters.get(path, 0)] + used)
+
+def append_journal(file_path, ops, read_rows=None):
+    """
+    Appends row-level operations to the file's journal. Insert ops without
+    "ids" get fresh row ids. The cost is proportional to the change, not the file.
+    read_rows(ids) -> current rows of ids (DuckDB mode): unless the full frame
+    is already cached, only the touched rows are read and nothing is cached.
+    """
+    with _path_lock(file_path):
+        key = (os.path.abspath(file_path), None)
+        old_version = data_version(file_path)
+        df = _cache_get(key, old_version)
+        if df is None and read_rows is None:
+            df = _read_dataset(file_path)
+
+        next_id = next_row_id(file_path, df)
+        for op in ops:
+            if op["op"] == "insert" and "ids" not in op:
+                op["ids"] = list(range(next_id, next_id + len(op["rows"])))
+                next_id += len(op["rows"])
+        _advance_row_id_counter(file_path, ops)
+
+        touched = pd.Index([int(row_id) for op in ops for row_id in op["ids"]]).unique()
+        # Read before writing: these are the rows as they were
+        removed_rows = read_rows(touched) if df is None else df.loc[df.index.intersection(touched)].copy()
+
+        with open(journal_path(file_path), "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op, default=_json_default) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Roll the cached frame forward instead of re-reading everything
+        invalidate_data_cache(file_path)
+        ops = json.loads(json.dumps(ops, default=_json_default))
+        new_version = data_version(file_path)
+        if df is not None:
+            df = _apply_ops(df, ops)
+            added_rows = df.loc[df.index.intersection(touched)]
+            _cache_put(key, new_version, df)
+        else:
+            added_rows = _apply_ops(removed_rows.copy(), ops)
+            added_rows = added_rows.loc[added_rows.index.intersection(touched)]
+        _notify_change(file_path, old_version, new_version, removed_rows, added_rows)
+
+    if os.path.getsize(journal_path(file_path)) > JOURNAL_COMPACT_BYTES:
+        _schedule_compaction(file_path)
+
+def compact_journal(file_path):
+    """Folds the journal into the base file and removes it."""
+    with _path_lock(file_path):
+        if not os.path.exists(journal_path(file_path)):
+            return
+        old_version = data_version(file_path)
+        was_cached = _cache_get((os.path.abspath(file_path), None), old_version) is not None
+        if _engine().engine_enabled(file_path):
+            # DuckDB streams base + journal into the new file, pandas never holds it all
+            df = None
+            next_id = next_row_id(file_path)
+            tmp_path = f"{file_path}.tmp"
+            _engine().write_parquet(file_path, tmp_path, {ROW_ID_COUNTER_KEY: str(next_id).encode()})
+            os.replace(tmp_path, file_path)
+            _row_id_counters[os.path.abspath(file_path)] = next_id
+        else:
+            df = _read_dataset(file_path)
+            next_id = next_row_id(file_path, df)
+            _write_base(df, file_path, next_id)
+        os.remove(journal_path(file_path))
+        invalidate_data_cache(file_path)
+        # Index is only kept by Parquet working copies, csv/xlsx rows get new ids
+        if file_path.endswith('.parquet'):
+            # Same content and ids under a new version: derived data only needs re-keying
+            _notify_change(file_path, old_version, data_version(file_path), None, None)
+            if was_cached and df is not None:  # DuckDB mode never holds the full frame, don't start now
+                _cache_put((os.path.abspath(file_path), None), data_version(file_path), df)
+        else:
+            _row_id_counters.pop(os.path.abspath(file_path), None)
+            _notify_change(file_path, old_version, None, None, None)
+
+def _schedule_compaction(file_path):
+    path = os.path.abspath(file_path)
+    with _path_locks_lock:
+        if path in _compacting:
+            return
+        _compacting.add(path)
+
+    def run():
+        try:
+            compact_journal(path)
+        except Exception as e:
+            print(f"Falha ao compactar o journal de {path}: {e}")
+        finally:
+            with _path_locks_lock:
+                _compacting.discard(path)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def _to_parquet_frame(df):
+    # Parquet needs one type per column; edits can leave mixed str/int/date values
+    out = apply_schema(df.copy())
+    for col in out.columns:
+        if out[col].dtype == object:
+            out[col] = out[col].where(out[col].isna(), out[col].astype(str))
+    return out
+
+def _write_parquet(df, file_path, next_id=None):
+    tmp_path = f"{file_path}.tmp"
+    table = pa.Table.from_pandas(_to_parquet_frame(df), preserve_index=True)
+    if next_id is None:
+        next_id = int(df.index.max()) + 1 if len(df) else 0
+    metadata = {**(table.schema.metadata or {}), ROW_ID_COUNTER_KEY: str(next_id).encode()}
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, file_path)
+    _row_id_counters[os.path.abspath(file_path)] = next_id
+
+def create_working_copy(source_path):
+    """
+    Parses an uploaded xlsx/csv once and stores it as a Parquet working copy
+    next to it. Returns the working copy path (or the source if pyarrow is missing).
+    """
+    if not HAS_PARQUET:
+        return source_path
+    working_path = f"{source_path}.parquet"
+    _write_parquet(_read_file(source_path), working_path)
+    return working_path
+
+def _write_base(df, file_path, next_id=None):
+    if file_path.endswith('.parquet'):
+        _write_parquet(df, file_path, next_id)
+    elif file_path.endswith('.csv'):
+        df.to_csv(file_path, index=False)
+    else:
+        writer_df = df.copy()
+        if 'Dia' in writer_df.columns:
+            writer_df['Dia'] = pd.to_datetime(writer_df['Dia']).dt.date
+        writer_df.to_excel(file_path, index=False)
+
+# --- Export ---
+_export_cache = {}  # path -> (version, bytes)
+
+def export_name(file_path):
+    """Original upload name for a cached file ('123_dados.xlsx.parquet' -> 'dados.xlsx')."""
+    file_name = os.path.basename(file_path)
+    if file_name.endswith('.parquet'):
+        file_name = file_name[:-len('.parquet')]
+    return file_name.split("_", 1)[-1] if "_" in file_name else file_name
+
+def _engine():
+    # Imported on use: engine.py imports this module
+    import engine
+    return engine
+
+def _export_batches(frames, as_csv):
+    """xlsx/csv bytes written frame by frame (DuckDB mode), never from one whole-dataset frame."""
+    if as_csv:
+        buffer = io.StringIO()
+        for i, part in enumerate(frames):
+            part.to_csv(buffer, index=False, header=i == 0)
+        return buffer.getvalue().encode('utf-8')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for i, part in enumerate(frames):
+        if i == 0:
+            sheet.append([str(c) for c in part.columns])
+        if 'Dia' in part.columns:
+            part['Dia'] = part['Dia'].dt.date
+        part = part.astype(object).where(part.notna(), None)
+        for row in part.itertuples(index=False):
+            sheet.append(list(row))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def export_file(file_path):
+    """
+    Returns the dataset as xlsx/csv bytes in the format it was uploaded in.
+    Called by the download button on click; reused until the dataset changes.
+    """
+    version = data_version(file_path)
+    cached = _export_cache.get(file_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    if not file_path.endswith('.parquet') and not os.path.exists(journal_path(file_path)):
+        with open(file_path, "rb") as f:
+            data = f.read()
+    elif _engine().engine_enabled(file_path):
+        data = _export_batches(_engine().iter_dataset(file_path), export_name(file_path).endswith('.csv'))
+    else:
+        df = load_data(file_path)
+        if export_name(file_path).endswith('.csv'):
+            data = df.to_csv(index=False).encode('utf-8')
+        else:
+            if 'Dia' in df.columns:
+                df['Dia'] = df['Dia'].dt.date
+            buffer = io.BytesIO()
+            df.to_excel(buffer, index=False)
+            data = buffer.getvalue()
+
+    _export_cache.clear()  # Only the active dataset is worth keeping
+    _export_cache[file_path] = (version, data)
+    return data
+
+# --- Rerun Timings ---
+# Per-section durations of the last reruns, to compare full page runs with
+# fragment reruns (shown with ?debug=1).
+TIMINGS_KEEP = 20
+
+def record_timing(section, start):
+    timings = st.session_state.setdefault("rerun_timings", {})
+    samples = timings.setdefault(section, [])
+    samples.append((time.perf_counter() - start) * 1000)
+    del samples[:-TIMINGS_KEEP]
+
+@contextmanager
+def timed(section):
+    """Context manager / decorator recording how long a page section took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(section, start)
+
+def show_rerun_timings():
+    timings = st.session_state.get("rerun_timings", {})
+    with st.expander("Tempos de Execução (ms)"):
+        if not timings:
+            st.caption("Nenhuma medição ainda.")
+            return
+        st.dataframe(pd.DataFrame([
+            {
+                "Seção": section,
+                "Última": round(samples[-1], 1),
+                "Média": round(sum(samples) / len(samples), 1),
+                "Execuções": len(samples),
+            }
+            for section, samples in timings.items()
+        ]), hide_index=True, use_container_width=True)
+
 # --- Options Management (for Editor) ---
 def load_options():
     defaults = {
@@ -121,10 +832,11 @@ def load_options():
     return defaults
 
 def save_options_file(data):
-    with open(OPTIONS_FILE, "w") as f:
-        json.dump(data, f)
+    _atomic_write_json(OPTIONS_FILE, data)
 
 # --- Settings Management ---
+_settings_lock = threading.Lock()
+
 def load_settings():
     if os.path.exists(SETTINGS_FILE):
         try:
@@ -134,6 +846,12 @@ def load_settings():
             return {}
     return {}
 
+def update_settings(**values):
+    """Merges values into settings.json, keeping the other keys."""
+    with _settings_lock:
+        settings = load_settings()
+        settings.update(values)
+        _atomic_write_json(SETTINGS_FILE, settings)
+
 def save_settings(s_name, s_email):
-    with open(SETTINGS_FILE, "w") as f:
-        json.dump({"sheet_name": s_name, "email_share": s_email}, f)
+    update_settings(sheet_name=s_name, email_share=s_email)